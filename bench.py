@@ -0,0 +1,122 @@
+"""
+插件路由的压测脚本。
+
+在本进程内启动 fake_tmdb 替身服务器, 把 TMDB_BASE_URL 指向它, 然后以固定并发驱动 main.app 的各个路由,
+报告每个场景的吞吐量、p50/p95/p99 延迟以及平均每个请求触发的上游调用次数。
+
+    python bench.py --requests 500 --concurrency 50 --latency 30
+    python bench.py --scenario search --scenario series-meta --rate-limit-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from urllib.parse import quote
+import fake_tmdb
+
+SEARCH_TERMS = ["周星驰", "漫威", "Batman", "哈利波特", "权力的游戏", "宫崎骏", "Nolan", "星际", "甄嬛传", "sherlock"]
+
+def _scenarios(rng):
+    """
+    场景名 -> 生成请求路径的函数。ID 和 skip 在有限范围内随机, 以混合缓存命中和未命中。
+    """
+    return {
+        "manifest": lambda: "/manifest.json",
+        "popular": lambda: f"/catalog/{rng.choice(['movie', 'series'])}/tmdb-popular/skip={rng.randrange(0, 200, 20)}.json",
+        "discover": lambda: "/catalog/movie/tmdb-discover-all/" + quote(f"排序={rng.choice(['热门', '评分', '发行日期'])}&skip={rng.randrange(0, 300, 10)}") + ".json",
+        "search": lambda: f"/catalog/{rng.choice(['movie', 'series'])}/tmdb-search/search={quote(rng.choice(SEARCH_TERMS))}.json",
+        "movie-meta": lambda: f"/meta/movie/tmdb:{rng.randint(1, 300)}.json",
+        "series-meta": lambda: f"/meta/series/tmdb:{rng.randint(1, 20) * fake_tmdb.LARGE_SERIES_EVERY}.json",
+    }
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_fake_tmdb(port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(fake_tmdb.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+async def _run_scenario(client, make_path, total, concurrency):
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(make_path())
+
+    async def worker():
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    fake_tmdb.reset_stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": _percentile(latencies, 0.50) * 1000,
+        "p95": _percentile(latencies, 0.95) * 1000,
+        "p99": _percentile(latencies, 0.99) * 1000,
+        "upstream": sum(fake_tmdb.STATS.values()) / total,
+        "statuses": statuses,
+    }
+
+async def run(args):
+    import httpx
+    import main
+
+    rng = random.Random(args.seed)
+    scenarios = _scenarios(rng)
+    names = args.scenario or list(scenarios)
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'scenario':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'upstream/req':>13}  statuses")
+            for name in names:
+                result = await _run_scenario(client, scenarios[name], args.requests, args.concurrency)
+                print(f"{name:<12} {result['rps']:>9.1f} {result['p50']:>9.1f} {result['p95']:>9.1f} "
+                      f"{result['p99']:>9.1f} {result['upstream']:>13.2f}  {result['statuses']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stremio TMDB 插件压测")
+    parser.add_argument("--requests", type=int, default=300, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发请求数")
+    parser.add_argument("--scenario", action="append", choices=list(_scenarios(random.Random())), help="只运行指定场景, 可重复")
+    parser.add_argument("--seed", type=int, default=42)
+    fake_tmdb.add_arguments(parser)
+    args = parser.parse_args()
+    fake_tmdb.configure_from_args(args)
+
+    port = _free_port()
+    server, thread = _start_fake_tmdb(port)
+    # 必须在导入 main (以及 config) 之前设置, 使所有 TMDB 请求发往替身服务器
+    os.environ["TMDB_BASE_URL"] = f"http://127.0.0.1:{port}/3"
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+if __name__ == "__main__":
+    sys.exit(main())
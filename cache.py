@@ -0,0 +1,459 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+from config import CACHE_MAX_ENTRIES, CACHE_BACKEND
+from metrics import CACHE_REQUESTS
+from records import MediaItem, Episode
+
+# 安装了 orjson 时用它编码二级缓存条目, 否则退回标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 二级缓存中每个条目的头部: 8 字节的过期时间戳 (Unix 秒, 大端 double)
+_HEADER = struct.Struct(">d")
+
+class CacheBackendError(Exception):
+    """
+    二级缓存后端不可用或返回了无法识别的数据。
+    """
+
+# 二级缓存的值以 JSON 保存而不使用 pickle: 能写入共享后端 (例如 Redis) 的人不应能借此在插件进程中执行代码。
+# JSON 不能直接表示的值编码为只有一个键的对象, 键以 NUL 开头, 不会与 TMDB 数据中的键冲突:
+# 元组、非字符串键的字典、字节串 (base64), 以及允许还原的记录类型 (按 __reduce__ 的参数保存, 参数都是简单值)
+_TUPLE, _DICT, _BYTES, _RECORD = "\0t", "\0d", "\0b", "\0r"
+_RECORDS = {cls.__name__: cls for cls in (MediaItem, Episode)}
+
+def _encode(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {_DICT: [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {_TUPLE: [_encode(item) for item in value]}
+    if isinstance(value, bytes):
+        return {_BYTES: base64.b64encode(value).decode("ascii")}
+    if _RECORDS.get(type(value).__name__) is type(value):
+        _, args = value.__reduce__()
+        return {_RECORD: [type(value).__name__, args]}
+    raise TypeError(f"无法写入二级缓存的值: {type(value).__name__}")
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        ((tag, data),) = value.items()
+        if tag == _TUPLE:
+            return tuple(_decode(item) for item in data)
+        if tag == _DICT:
+            return {_decode(key): _decode(item) for key, item in data}
+        if tag == _BYTES:
+            return base64.b64decode(data)
+        if tag == _RECORD:
+            name, args = data
+            return _RECORDS[name](*args)
+    return {key: _decode(item) for key, item in value.items()}
+
+def _pack(value, expires_at):
+    if orjson is not None:
+        body = orjson.dumps(_encode(value))
+    else:
+        body = json.dumps(_encode(value), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(expires_at) + body
+
+def _unpack(data):
+    """
+    解析二级缓存条目, 返回 (过期时间, 值)。数据无法识别时抛出 ValueError、TypeError、KeyError 或 struct.error。
+    """
+    (expires_at,) = _HEADER.unpack_from(data)
+    body = data[_HEADER.size:]
+    return expires_at, _decode(orjson.loads(body) if orjson is not None else json.loads(body))
+
+class LRUCache:
+    """
+    进程内 LRU 缓存。每个条目带有独立的 TTL, 超出容量时淘汰最久未使用的条目。
+    过期的条目不会立即删除, 在被淘汰之前仍可以通过 get_stale 读取, 用于上游故障时降级。
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        """
+        返回条目的值, 不论是否已经过期。
+        """
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def entries(self):
+        """
+        返回所有条目的副本: [(键, 过期时间, 值)], 按最久未使用到最近使用排列。
+        """
+        return [(key, expires_at, value) for key, (expires_at, value) in self._data.items()]
+
+    def clear(self):
+        self._data.clear()
+
+class FileBackend:
+    """
+    本地文件二级缓存, 每个键对应目录下的一个文件。
+    过期的文件在再次读取时删除, 另外每写入 PURGE_EVERY 次扫描整个目录, 删除其余过期的文件。
+    """
+    # 每写入这么多次清理一次过期文件
+    PURGE_EVERY = 1000
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._writes = 0
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < _HEADER.size or _HEADER.unpack_from(data)[0] <= time.time():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return data
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换, 避免并发读到写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge()
+
+    def _purge(self):
+        now = time.time()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                # 跳过其它写入者尚未替换到位的临时文件
+                if name.startswith(tempfile.gettempprefix()):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "rb") as f:
+                        header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size or _HEADER.unpack(header)[0] <= now:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def get(self, key):
+        try:
+            return await asyncio.to_thread(self._read, key)
+        except OSError as e:
+            raise CacheBackendError(e) from e
+
+    async def set(self, key, data, ttl):
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            raise CacheBackendError(e) from e
+
+    async def close(self):
+        pass
+
+class RedisBackend:
+    """
+    基于 RESP 协议的二级缓存, 可连接 Redis 或任何兼容 Redis 协议的服务。
+    只使用 GET/SET 命令, 所有命令在一个长连接上串行执行。
+    """
+    def __init__(self, host="localhost", port=6379, db=0, password=None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", str(self.db))
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheBackendError("Redis 连接已关闭")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body
+        if prefix == b"-":
+            raise CacheBackendError(body.decode(errors="replace"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise CacheBackendError(f"无法识别的 Redis 响应: {line!r}")
+
+    async def _command(self, *args):
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._send(*args)
+            except (OSError, asyncio.IncompleteReadError, CacheBackendError) as e:
+                self._disconnect()
+                raise CacheBackendError(e) from e
+
+    async def get(self, key):
+        return await self._command("GET", key)
+
+    async def set(self, key, data, ttl):
+        await self._command("SET", key, data, "PX", str(max(int(ttl * 1000), 1)))
+
+    async def close(self):
+        self._disconnect()
+
+class SQLiteBackend:
+    """
+    本地 SQLite (WAL 模式) 二级缓存, 同一主机上的多个 worker 进程可以共享同一个数据库文件。
+    每个线程使用独立的连接, 读写在线程池中执行, 不阻塞事件循环。
+    """
+    # 每写入这么多次清理一次过期条目
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _read(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write(self, key, data, ttl):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, data, now + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    async def get(self, key):
+        try:
+            return await asyncio.to_thread(self._read, key)
+        except sqlite3.Error as e:
+            raise CacheBackendError(e) from e
+
+    async def set(self, key, data, ttl):
+        try:
+            await asyncio.to_thread(self._write, key, data, ttl)
+        except sqlite3.Error as e:
+            raise CacheBackendError(e) from e
+
+    async def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+def create_backend(url):
+    """
+    根据 CACHE_BACKEND 配置创建二级缓存后端, 未配置时返回 None。
+    支持 "file:///path/to/dir"、"sqlite:///path/to/cache.db" 和 "redis://[:password@]host:port/db"。
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return FileBackend(unquote(parsed.path))
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(unquote(parsed.path))
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        password = unquote(parsed.password) if parsed.password else None
+        return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379, db, password)
+    raise ValueError(f"不支持的 CACHE_BACKEND: {url}")
+
+# 所有 TieredCache 实例: 名称 -> 缓存, 供 snapshot.py 保存和恢复进程内缓存
+CACHES = {}
+
+class TieredCache:
+    """
+    两级缓存: 先查进程内 LRU, 未命中时再查可选的二级后端, 命中后回填到 LRU。
+    二级后端出错时只记录错误并当作未命中处理。name 用于区分各个缓存的命中率指标。
+    启动时恢复了快照 (snapshot.py) 时, 在查询二级后端之前先从快照中按需加载。
+    """
+    def __init__(self, memory, backend=None, name="tmdb"):
+        self.memory = memory
+        self.backend = backend
+        self.name = name
+        self.snapshot = None
+        CACHES[name] = self
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(self.name, "memory_hit")
+            return value
+        value = self._get_from_snapshot(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(self.name, "snapshot_hit")
+            return value
+        value = await self._get_from_backend(key)
+        CACHE_REQUESTS.inc(self.name, "miss" if value is None else "backend_hit")
+        return value
+
+    def _get_from_snapshot(self, key):
+        if self.snapshot is None:
+            return None
+        entry = self.snapshot.pop(self.name, key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        self.memory.set(key, value, expires_at - time.time())
+        return value
+
+    async def _get_from_backend(self, key):
+        if self.backend is None:
+            return None
+        try:
+            data = await self.backend.get(key)
+        except CacheBackendError as e:
+            logger.warning(f"读取二级缓存时发生错误: {e}")
+            return None
+        if data is None:
+            return None
+        try:
+            expires_at, value = _unpack(data)
+        except (struct.error, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"解析二级缓存条目时发生错误: {e}")
+            return None
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return None
+        self.memory.set(key, value, ttl)
+        return value
+
+    def get_stale(self, key):
+        """
+        返回进程内缓存中的值, 即使已经过期 (最后一次成功获取的数据)。
+        """
+        return self.memory.get_stale(key)
+
+    async def set(self, key, value, ttl):
+        self.memory.set(key, value, ttl)
+        if self.snapshot is not None:
+            self.snapshot.discard(self.name, key)
+        if self.backend is None:
+            return
+        try:
+            data = _pack(value, time.time() + ttl)
+        except TypeError as e:
+            logger.warning(f"写入二级缓存时发生错误: {e}")
+            return
+        try:
+            await self.backend.set(key, data, ttl)
+        except CacheBackendError as e:
+            logger.warning(f"写入二级缓存时发生错误: {e}")
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+# 全局共享的 TMDB 响应缓存
+cache = TieredCache(LRUCache(), create_backend(CACHE_BACKEND))
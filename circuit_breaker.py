@@ -0,0 +1,119 @@
+"""
+按 TMDB 接口划分的熔断器, 以及记录当前响应是否降级 (使用了过期数据或上游出错) 的上下文。
+"""
+import time
+from contextvars import ContextVar
+import httpx
+from config import TMDB_BREAKER_THRESHOLD, TMDB_BREAKER_COOLDOWN
+from metrics import Counter, Gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(httpx.HTTPError):
+    """
+    熔断器处于打开状态, 请求没有发出就直接失败。
+    继承 httpx.HTTPError, 调用方可以像处理其它上游错误一样处理。
+    """
+
+class CircuitBreaker:
+    """
+    连续失败 threshold 次后打开, cooldown 秒内的请求直接失败而不再等待超时;
+    冷却结束后进入半开状态, 只放行一个探测请求: 成功则关闭, 失败则重新打开。
+    网络错误 (含超时)、无法解析的响应体和 5xx 响应计为失败, 其余响应 (包括 404 和重试用尽的 429) 计为成功。
+    """
+    def __init__(self, name, threshold=TMDB_BREAKER_THRESHOLD, cooldown=TMDB_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def check(self):
+        """
+        熔断器打开 (或半开且探测请求尚未结束) 时抛出 CircuitOpenError, 用于在排队之前快速失败。
+        """
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._probing):
+            raise CircuitOpenError(f"TMDB 接口 {self.name} 暂时不可用, 熔断器已打开")
+        return state
+
+    def _acquire(self):
+        if self.check() == HALF_OPEN:
+            self._probing = True
+
+    def _record(self, ok):
+        self._probing = False
+        if ok:
+            self._failures = 0
+            self._opened_at = None
+            return
+        self._failures += 1
+        # 半开状态下的探测失败会立即重新打开
+        if self._opened_at is not None or self._failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+    async def call(self, send):
+        """
+        通过熔断器执行 send() 并返回 httpx.Response; 熔断器打开时抛出 CircuitOpenError。
+        """
+        self._acquire()
+        try:
+            response = await send()
+        except (httpx.TransportError, httpx.DecodingError):
+            self._record(False)
+            raise
+        except BaseException:
+            # 被取消时不计入结果, 只释放探测名额
+            self._probing = False
+            raise
+        self._record(response.status_code < 500)
+        return response
+
+_breakers = {}
+
+def get_breaker(endpoint):
+    """
+    返回指定接口 (例如 "/discover/movie") 的熔断器, 首次调用时创建。
+    """
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+Gauge("tmdb_circuit_open", "各 TMDB 接口的熔断器是否打开 (半开也计为 1)", ("endpoint",), function=lambda: {
+    (endpoint,): int(breaker.state != CLOSED) for endpoint, breaker in _breakers.items()
+})
+STALE_SERVED = Counter("tmdb_stale_served_total", "上游失败时使用过期缓存的次数", ("endpoint",))
+
+# 当前响应在构建过程中遇到的上游故障, 仅在 track_degraded() 之后为集合
+_degraded = ContextVar("degraded", default=None)
+
+def track_degraded():
+    """
+    在当前上下文中开始记录上游故障, 返回收集故障的集合; 之后创建的子任务共享同一个集合。
+    """
+    reasons = set()
+    _degraded.set(reasons)
+    return reasons
+
+def mark_degraded(reason):
+    """
+    记录一次上游故障, 例如 "stale:/discover/movie" 或 "error:/tv/{id}"。没有开始记录时忽略。
+    """
+    reasons = _degraded.get()
+    if reasons is not None:
+        reasons.add(reason)
+
+def is_degraded():
+    return bool(_degraded.get())
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
@@ -7,6 +8,9 @@ load_dotenv()
 # TMDB API 读访问令牌
 TMDB_ACCESS_TOKEN = os.getenv("TMDB_ACCESS_TOKEN")
 
+# [可选] TMDB API 地址, 压测时可以指向本地的替身服务器 (fake_tmdb.py)
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+
 # [可选] 代理配置
 http_proxy = os.getenv("HTTP_PROXY")
 https_proxy = os.getenv("HTTPS_PROXY")
@@ -16,6 +20,48 @@ if http_proxy:
 if https_proxy:
     PROXIES["https"] = https_proxy
 
+# [可选] TMDB HTTP 客户端配置: 连接池大小、超时 (秒) 以及是否启用 HTTP/2
+TMDB_HTTP2 = os.getenv("TMDB_HTTP2", "true").lower() == "true"
+TMDB_MAX_CONNECTIONS = int(os.getenv("TMDB_MAX_CONNECTIONS", "100"))
+TMDB_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TMDB_MAX_KEEPALIVE_CONNECTIONS", "20"))
+TMDB_CONNECT_TIMEOUT = float(os.getenv("TMDB_CONNECT_TIMEOUT", "5"))
+TMDB_READ_TIMEOUT = float(os.getenv("TMDB_READ_TIMEOUT", "10"))
+
+# [可选] TMDB 故障保护: 每次实际发出的上游请求 (不含限流排队) 的时限 (秒),
+# 以及同一接口连续失败多少次后熔断、熔断后多少秒再尝试恢复
+TMDB_REQUEST_DEADLINE = float(os.getenv("TMDB_REQUEST_DEADLINE", "15"))
+TMDB_BREAKER_THRESHOLD = int(os.getenv("TMDB_BREAKER_THRESHOLD", "5"))
+TMDB_BREAKER_COOLDOWN = float(os.getenv("TMDB_BREAKER_COOLDOWN", "30"))
+
+# [可选] TMDB 限流配置: 每秒请求数、令牌桶容量, 以及遇到 429/5xx/网络错误时的最大重试次数
+# 多 worker 部署时, 每秒请求数和令牌桶容量会按 WEB_CONCURRENCY 平均分给各个进程
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "40"))
+TMDB_RATE_BURST = int(os.getenv("TMDB_RATE_BURST", "40"))
+TMDB_MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", "3"))
+
+# [可选] 缓存配置: 进程内 LRU 的最大条目数, 以及二级缓存后端
+# 二级缓存支持 "file:///path/to/dir"、"sqlite:///path/to/cache.db" 或 "redis://[:password@]host:port/db",
+# 留空则只使用进程内缓存。多 worker 部署时应配置二级缓存, 使各进程共享缓存
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "")
+# 已序列化的 Stremio 响应 (manifest / catalog / meta) 在进程内缓存的最大条目数
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# 进程内缓存的快照文件, 关闭时和每隔 CACHE_SNAPSHOT_INTERVAL 秒写入一次, 启动时恢复; 留空则不使用快照
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "")
+CACHE_SNAPSHOT_INTERVAL = float(os.getenv("CACHE_SNAPSHOT_INTERVAL", "300"))
+
+# [可选] 批量 meta 接口: 单次请求最多的 ID 数, 以及同时解析的 ID 数
+META_BATCH_MAX_IDS = int(os.getenv("META_BATCH_MAX_IDS", "1000"))
+META_BATCH_CONCURRENCY = int(os.getenv("META_BATCH_CONCURRENCY", "8"))
+
+# [可选] 由 tmdb_index.py 从 TMDB 每日导出文件构建的本地索引, 用于本地解析 IMDb ID 和标题搜索
+TMDB_INDEX_PATH = os.getenv("TMDB_INDEX_PATH", "")
+
+# [可选] 多 worker 部署: worker 进程数 (与 uvicorn / gunicorn 读取的环境变量相同),
+# 以及进程间锁文件所在的目录
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+LOCK_DIR = os.getenv("LOCK_DIR", tempfile.gettempdir())
+
 # Stremio 插件配置
 PLUGIN_ID = "com.example.stremio-tmdb-plugin"
 PLUGIN_VERSION = "1.0.1"
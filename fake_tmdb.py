@@ -0,0 +1,192 @@
+"""
+本地 TMDB 替身服务器, 用于压测和离线开发。
+
+返回结构与 TMDB API 一致的合成数据 (同一请求总是返回相同内容), 也可以从录制的 JSON 文件返回固定响应。
+支持注入延迟、5xx 错误和 429 限流, 并统计每个接口收到的请求数。
+
+    python fake_tmdb.py --port 8001 --latency 50 --error-rate 0.01 --rate-limit-rate 0.02
+    TMDB_BASE_URL=http://127.0.0.1:8001/3 uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import zlib
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# 注入的故障和延迟, 可通过命令行参数或 configure() 修改
+SETTINGS = {
+    "latency": 0.0,          # 平均延迟 (秒), 实际延迟在 [0.5, 1.5] 倍之间随机
+    "error_rate": 0.0,       # 返回 500 的概率
+    "rate_limit_rate": 0.0,  # 返回 429 的概率
+    "retry_after": 1,        # 429 响应的 Retry-After (秒)
+    "fixtures": None,        # 录制的响应目录, 例如 fixtures/movie/550.json 对应 /3/movie/550
+}
+# 剧集 ID 是该数的倍数时生成长篇剧集 (40 季), 用于压测大型剧集的 meta
+LARGE_SERIES_EVERY = 100
+
+# 按接口统计收到的请求数, 路径中的数字 ID 被替换为 {id}
+STATS = Counter()
+
+app = FastAPI()
+
+GENRES = {
+    "movie": [(28, "动作"), (12, "冒险"), (16, "动画"), (35, "喜剧"), (80, "犯罪"), (18, "剧情"), (14, "奇幻"), (27, "恐怖"), (878, "科幻"), (53, "惊悚")],
+    "tv": [(10759, "动作冒险"), (16, "动画"), (35, "喜剧"), (80, "犯罪"), (18, "剧情"), (9648, "悬疑"), (10765, "Sci-Fi & Fantasy")],
+}
+
+def configure(**settings):
+    SETTINGS.update(settings)
+
+def reset_stats():
+    STATS.clear()
+
+def _rng(*parts):
+    return random.Random(zlib.crc32("/".join(map(str, parts)).encode()))
+
+def _date(rng, start_year=1980, end_year=2024):
+    return f"{rng.randint(start_year, end_year)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+def _list_item(media_type, tmdb_id):
+    rng = _rng(media_type, tmdb_id)
+    item = {
+        "adult": False, "backdrop_path": f"/b{tmdb_id}.jpg", "genre_ids": [rng.choice(GENRES[media_type])[0] for _ in range(2)],
+        "id": tmdb_id, "original_language": "en", "overview": f"简介 {tmdb_id} " * 8,
+        "popularity": round(rng.uniform(1, 500), 3), "poster_path": f"/p{tmdb_id}.jpg",
+        "vote_average": round(rng.uniform(4, 9), 1), "vote_count": rng.randint(10, 20000), "media_type": media_type,
+    }
+    if media_type == "movie":
+        item.update({"title": f"电影 {tmdb_id}", "original_title": f"Movie {tmdb_id}", "release_date": _date(rng), "video": False})
+    else:
+        item.update({"name": f"剧集 {tmdb_id}", "original_name": f"Series {tmdb_id}", "first_air_date": _date(rng), "origin_country": ["US"]})
+    return item
+
+def _page(media_type, seed, page):
+    rng = _rng(media_type, seed, page)
+    return {"page": page, "results": [_list_item(media_type, rng.randint(1, 99999)) for _ in range(20)], "total_pages": 500, "total_results": 10000}
+
+def _credits(media_type, tmdb_id):
+    rng = _rng("credits", media_type, tmdb_id)
+    cast = [{"id": 1000 + i, "name": f"演员 {tmdb_id}-{i}", "character": f"角色 {i}", "order": i, "popularity": rng.uniform(1, 50), "profile_path": f"/c{i}.jpg"} for i in range(rng.randint(15, 60))]
+    crew = [{"id": 5000 + i, "name": f"职员 {tmdb_id}-{i}", "job": "Director" if i == 0 else rng.choice(["Writer", "Producer", "Editor"]), "department": "Directing" if i == 0 else "Crew"} for i in range(rng.randint(10, 80))]
+    return {"id": tmdb_id, "cast": cast, "crew": crew}
+
+def _season_count(tv_id):
+    return 40 if tv_id % LARGE_SERIES_EVERY == 0 else 1 + tv_id % 6
+
+def _season(tv_id, number):
+    rng = _rng("season", tv_id, number)
+    year = 1990 + number
+    episodes = [{
+        "air_date": f"{year}-{(e % 12) + 1:02d}-{rng.randint(1, 28):02d}", "episode_number": e, "id": tv_id * 10000 + number * 100 + e,
+        "name": f"第 {e} 集", "overview": f"第 {number} 季第 {e} 集简介。" * 4, "season_number": number, "still_path": f"/s{tv_id}-{number}-{e}.jpg",
+        "vote_average": round(rng.uniform(5, 9), 1), "runtime": 45,
+        "crew": [{"id": i, "name": f"职员 {i}", "job": "Writer"} for i in range(5)],
+        "guest_stars": [{"id": i, "name": f"客串 {i}", "character": f"角色 {i}"} for i in range(6)],
+    } for e in range(1, rng.randint(8, 24))]
+    return {"_id": f"{tv_id}-{number}", "air_date": f"{year}-01-01", "episodes": episodes, "name": f"第 {number} 季", "season_number": number, "id": tv_id * 100 + number}
+
+def _details(media_type, tmdb_id, append):
+    data = _list_item(media_type, tmdb_id)
+    data.pop("genre_ids")
+    data.pop("media_type")
+    data["genres"] = [{"id": genre_id, "name": name} for genre_id, name in GENRES[media_type][:3]]
+    if media_type == "tv":
+        count = _season_count(tmdb_id)
+        data.update({
+            "status": "Ended" if tmdb_id % 3 == 0 else "Returning Series", "last_air_date": f"{1990 + count}-12-01",
+            "created_by": [{"id": 1, "name": f"主创 {tmdb_id}"}], "number_of_seasons": count,
+            "seasons": [{"season_number": n, "air_date": f"{1990 + n}-01-01", "episode_count": 10} for n in range(0, count + 1)],
+            "last_episode_to_air": {"season_number": count, "episode_number": 1},
+        })
+    for part in append:
+        if part == "external_ids":
+            data["external_ids"] = {"imdb_id": f"tt{tmdb_id:07d}"}
+        elif part == "credits":
+            data["credits"] = _credits(media_type, tmdb_id)
+        elif part.startswith("season/") and media_type == "tv":
+            data[part] = _season(tmdb_id, int(part.split("/", 1)[1]))
+    return data
+
+def _generate(path, params):
+    parts = path.strip("/").split("/")
+    page = int(params.get("page", 1))
+    append = [p for p in params.get("append_to_response", "").split(",") if p]
+    if parts[:1] == ["genre"]:
+        return {"genres": [{"id": genre_id, "name": name} for genre_id, name in GENRES[parts[1]]]}
+    if parts[:1] == ["discover"]:
+        return _page(parts[1], json.dumps(sorted(params.items())), page)
+    if parts == ["search", "multi"]:
+        return _page(random.Random(params.get("query")).choice(["movie", "tv"]), params.get("query"), page)
+    if parts == ["search", "person"]:
+        rng = _rng("person", params.get("query"))
+        return {"results": [{"id": rng.randint(1, 9999), "name": params.get("query"), "popularity": rng.uniform(1, 100)}]}
+    if parts[:1] == ["person"]:
+        rng = _rng("person", parts[1])
+        works = [_list_item(rng.choice(["movie", "tv"]), rng.randint(1, 99999)) for _ in range(rng.randint(5, 40))]
+        return {"cast": works[::2], "crew": works[1::2]}
+    if parts[:1] == ["find"]:
+        tmdb_id = int(re.sub(r"\D", "", parts[1]) or 0)
+        return {"movie_results": [{"id": tmdb_id}], "tv_results": [{"id": tmdb_id}]}
+    if len(parts) == 2 and parts[0] in ("movie", "tv"):
+        return _details(parts[0], int(parts[1]), append)
+    if len(parts) == 3 and parts[2] == "credits":
+        return _credits(parts[0], int(parts[1]))
+    if len(parts) == 4 and parts[0] == "tv" and parts[2] == "season":
+        return _season(int(parts[1]), int(parts[3]))
+    return None
+
+def _load_fixture(path):
+    fixture = os.path.join(SETTINGS["fixtures"], path.strip("/") + ".json")
+    if not os.path.isfile(fixture):
+        return None
+    with open(fixture, encoding="utf-8") as f:
+        return json.load(f)
+
+@app.get("/__stats")
+def stats():
+    return dict(STATS)
+
+@app.get("/3/{path:path}")
+async def tmdb(request: Request, path: str):
+    STATS[re.sub(r"/(tt)?\d+", "/{id}", f"/{path}")] += 1
+    if SETTINGS["latency"]:
+        await asyncio.sleep(SETTINGS["latency"] * random.uniform(0.5, 1.5))
+    roll = random.random()
+    if roll < SETTINGS["rate_limit_rate"]:
+        return JSONResponse({"status_code": 25, "status_message": "Your request count is over the allowed limit."},
+                            status_code=429, headers={"Retry-After": str(SETTINGS["retry_after"])})
+    if roll < SETTINGS["rate_limit_rate"] + SETTINGS["error_rate"]:
+        return JSONResponse({"status_code": 11, "status_message": "Internal error."}, status_code=500)
+
+    data = _load_fixture(path) if SETTINGS["fixtures"] else None
+    if data is None:
+        data = _generate(path, dict(request.query_params))
+    if data is None:
+        return JSONResponse({"status_code": 34, "status_message": "The resource you requested could not be found."}, status_code=404)
+    return data
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="平均响应延迟 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After (秒)")
+    parser.add_argument("--fixtures", default=None, help="录制的 JSON 响应目录")
+
+def configure_from_args(args):
+    configure(latency=args.latency / 1000, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+              retry_after=args.retry_after, fixtures=args.fixtures)
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="本地 TMDB 替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,38 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from config import LOCK_DIR
+
+# fcntl 只在类 Unix 系统上可用, 其他平台上 host_lock 不做任何事
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+@asynccontextmanager
+async def host_lock(name, blocking=True):
+    """
+    同一主机上所有 worker 进程之间的互斥锁 (基于 flock), 返回是否获得了锁。
+    用于启动预热等只需在每台主机上执行一次的操作: 第一个进程执行并写入共享缓存,
+    其余进程等待它完成后再执行, 此时只会命中缓存。
+    blocking 为 False 时不等待: 锁被其它进程持有时直接返回 False。
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    fd = os.open(os.path.join(LOCK_DIR, f"stremio-tmdb-{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if blocking:
+            # flock 会阻塞, 在线程池中等待以免阻塞事件循环; 关闭文件描述符时锁自动释放
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            acquired = True
+        else:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+        yield acquired
+    finally:
+        os.close(fd)
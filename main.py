@@ -1,9 +1,66 @@
-from fastapi import FastAPI, Request
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from stremio import get_manifest, get_catalog, get_meta
+from stremio import (
+    get_manifest, manifest_ready, build_manifest, get_catalog, get_meta, warm_up, refresh_manifest, refresh_manifest_periodically,
+    cancel_background_tasks, META_ID_PATTERN
+)
+from tmdb import close_client
+from cache import cache
+from host_lock import host_lock
+from snapshot import load_snapshot, close_snapshot, revalidate_snapshot, save_snapshot, save_snapshot_periodically
+import metrics
+from config import META_BATCH_MAX_IDS, META_BATCH_CONCURRENCY, CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_INTERVAL
+from response_cache import cached_body, cached_json, cache_control, json_response, dumps, EMPTY_MAX_AGE
+from user_config import DEFAULT_CONFIG, parse_config
 from typing import Optional
 
-app = FastAPI()
+# 各路由序列化后响应的缓存时间 (秒)
+MANIFEST_TTL = 3600
+CATALOG_TTL = 15 * 60
+SEARCH_TTL = 5 * 60
+META_TTL = 3600
+
+async def warm_up_in_background():
+    """
+    后台任务: 构建 manifest 并预热首页目录, 之后定期刷新 manifest。
+    多 worker 部署时只有第一个进程执行预热并请求 TMDB; 其余进程等它完成后只构建 manifest, 此时命中共享缓存。
+    """
+    async with host_lock("warmup", blocking=False) as acquired:
+        if acquired:
+            ok = await warm_up()
+    if not acquired:
+        async with host_lock("warmup"):
+            ok = await refresh_manifest()
+    await refresh_manifest_periodically(ok)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时先挂上上次保存的缓存快照 (按需加载), 预热请求大多可以直接命中快照
+    snapshot = load_snapshot(CACHE_SNAPSHOT_PATH)
+    # 预热在后台执行, 不等待 TMDB 就开始接受请求; 预热完成之前 manifest 使用不含类型列表的占位版本
+    tasks = [asyncio.create_task(warm_up_in_background())]
+    if snapshot is not None:
+        tasks.append(asyncio.create_task(revalidate_snapshot(snapshot)))
+    if CACHE_SNAPSHOT_PATH:
+        tasks.append(asyncio.create_task(save_snapshot_periodically(CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await cancel_background_tasks()
+    # 关闭时保存缓存快照, 然后释放快照、TMDB 客户端的连接池和二级缓存连接
+    if CACHE_SNAPSHOT_PATH:
+        await save_snapshot(CACHE_SNAPSHOT_PATH)
+    if snapshot is not None:
+        close_snapshot(snapshot)
+    await close_client()
+    await cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置 CORS 中间件
 app.add_middleware(
@@ -12,31 +69,79 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Warning", "X-Upstream-Trace"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    记录每个路由的耗时; 请求带有 ?debug=trace 或 X-Debug-Trace: 1 时,
+    在 X-Upstream-Trace 响应头中列出本次请求的每个上游调用及其耗时。
+    """
+    traced = request.query_params.get("debug") == "trace" or request.headers.get("x-debug-trace") == "1"
+    calls = metrics.start_trace() if traced else None
+    started = time.perf_counter()
+    response = await call_next(request)
+    duration = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.ROUTE_LATENCY.observe(duration, route.path if route else "unmatched", response.status_code)
+    if calls is not None:
+        response.headers["X-Upstream-Trace"] = metrics.format_trace(calls)
+        response.headers["Server-Timing"] = f"app;dur={duration * 1000:.1f}"
+    return response
+
 @app.get("/")
 def root():
     return {"message": "Stremio TMDB Addon is running!"}
 
+@app.get("/metrics")
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _user_config(request):
+    """
+    解析地址路径中的用户配置 (/{config}/manifest.json 等), 不带配置段的路由使用默认配置。
+    """
+    text = request.path_params.get("config")
+    if not text:
+        return DEFAULT_CONFIG
+    try:
+        return parse_config(text)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# 每个插件路由都同时注册不带配置段和带配置段 (/{config}/...) 的版本, 后者在前者之后注册
+@app.get("/{config}/manifest.json")
 @app.get("/manifest.json")
-async def read_manifest():
-    return await get_manifest()
+async def read_manifest(request: Request):
+    config = _user_config(request)
+    if config == DEFAULT_CONFIG:
+        body, etag = get_manifest()
+        # 启动预热完成之前是不含类型列表的占位 manifest, 只允许客户端短暂缓存
+        cache_control_header = cache_control(MANIFEST_TTL) if manifest_ready() else f"public, max-age={EMPTY_MAX_AGE}"
+        return json_response(request, body, etag, cache_control_header)
+    return await cached_json(request, f"manifest:{config.key}", MANIFEST_TTL, lambda: build_manifest(config))
 
 # 新增: 处理不带 extra_props 的 catalog 请求
+@app.get("/{config}/catalog/{media_type}/{catalog_id}.json")
 @app.get("/catalog/{media_type}/{catalog_id}.json")
 async def read_catalog_simple(request: Request, media_type: str, catalog_id: str):
     """
     处理不带 extra_props 的 catalog 请求, 例如主页上的热门和高分榜。
     """
-    return await get_catalog(request, media_type, catalog_id)
+    config = _user_config(request)
+    key = f"catalog:{config.key}:{media_type}:{catalog_id}"
+    return await cached_json(request, key, CATALOG_TTL, lambda: get_catalog(request, media_type, catalog_id, config=config))
 
 # 修改: 处理带 extra_props 的 catalog 请求
+@app.get("/{config}/catalog/{media_type}/{catalog_id}/{extra_props:path}.json")
 @app.get("/catalog/{media_type}/{catalog_id}/{extra_props:path}.json")
 async def read_catalog_with_extras(request: Request, media_type: str, catalog_id: str, extra_props: Optional[str] = None):
     """
     处理所有带 extra_props 的 catalog 请求。
     对于搜索请求, 它会进行特殊的、更健壮的解析。
     """
+    config = _user_config(request)
     extra_args = {}
     if extra_props:
         clean_props = extra_props.replace(".json", "")
@@ -56,11 +161,81 @@ async def read_catalog_with_extras(request: Request, media_type: str, catalog_id
                 # 忽略格式错误的参数
                 pass
 
-    return await get_catalog(request, media_type, catalog_id, extra_args)
+    ttl = SEARCH_TTL if catalog_id == 'tmdb-search' else CATALOG_TTL
+    key = f"catalog:{config.key}:{media_type}:{catalog_id}:" + "&".join(f"{k}={v}" for k, v in sorted(extra_args.items()))
+    return await cached_json(request, key, ttl, lambda: get_catalog(request, media_type, catalog_id, extra_args, config))
+
+def _meta_key(request, config, media_type, tmdb_id):
+    # meta 中的链接包含插件地址 (主机名和配置段), 因此缓存键需要区分两者
+    return f"meta:{request.url.netloc}:{config.key}:{media_type}:{tmdb_id}"
+
+async def _stream_metas(request, config, media_type, ids):
+    """
+    以有限的并发解析多个 ID, 每解析完一个就输出一行 NDJSON: {"id": ..., "meta": {...}}。
+    与单个 meta 路由共用响应缓存, 已缓存的 ID 不会再请求 TMDB。
+    """
+    semaphore = asyncio.Semaphore(META_BATCH_CONCURRENCY)
+
+    async def fetch(tmdb_id):
+        async with semaphore:
+            key = _meta_key(request, config, media_type, tmdb_id)
+            body, _, _ = await cached_body(key, META_TTL, lambda: get_meta(request, media_type, tmdb_id, config))
+        return tmdb_id, body
+
+    tasks = [asyncio.create_task(fetch(tmdb_id)) for tmdb_id in ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            tmdb_id, body = await next_done
+            # 缓存的响应体是 {"meta": ...} 形式的 JSON 对象, 直接在开头插入 id 字段
+            yield b'{"id":' + dumps(tmdb_id) + b"," + body[1:] + b"\n"
+    finally:
+        # 客户端提前断开时取消尚未完成的解析
+        for task in tasks:
+            task.cancel()
+
+def _batch_response(request, media_type, ids):
+    config = _user_config(request)
+    # ID 可以是字符串或整数 (TMDB ID), 其它类型和格式不对的 ID 直接拒绝, 不会发往 TMDB
+    if any(isinstance(tmdb_id, bool) or not isinstance(tmdb_id, (str, int)) for tmdb_id in ids):
+        raise HTTPException(status_code=400, detail="ID 必须是字符串或整数")
+    ids = list(dict.fromkeys(str(tmdb_id).strip() for tmdb_id in ids if str(tmdb_id).strip()))
+    invalid = [tmdb_id for tmdb_id in ids if not META_ID_PATTERN.fullmatch(tmdb_id)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"无效的 ID: {invalid[0]}")
+    if len(ids) > META_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"一次最多请求 {META_BATCH_MAX_IDS} 个 ID")
+    return StreamingResponse(_stream_metas(request, config, media_type, ids), media_type="application/x-ndjson")
+
+# 批量路由必须在 /meta/{media_type}/{tmdb_id}.json 之前注册, 否则 "batch" 会被当作 ID
+@app.get("/{config}/meta/{media_type}/batch.json")
+@app.get("/meta/{media_type}/batch.json")
+async def read_meta_batch(request: Request, media_type: str, ids: str = ""):
+    """
+    批量获取元数据, 例如 /meta/movie/batch.json?ids=tmdb:550,tt0111161。结果以 NDJSON 流式返回。
+    """
+    return _batch_response(request, media_type, ids.split(","))
+
+@app.post("/{config}/meta/{media_type}/batch.json")
+@app.post("/meta/{media_type}/batch.json")
+async def post_meta_batch(request: Request, media_type: str):
+    """
+    与 GET 版本相同, ID 列表通过 JSON 请求体传入: {"ids": [...]}。
+    """
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体必须是 JSON")
+    ids = payload.get("ids") if isinstance(payload, dict) else None
+    if not isinstance(ids, list):
+        raise HTTPException(status_code=400, detail='请求体必须包含 "ids" 列表')
+    return _batch_response(request, media_type, ids)
 
+@app.get("/{config}/meta/{media_type}/{tmdb_id}.json")
 @app.get("/meta/{media_type}/{tmdb_id}.json")
 async def read_meta(request: Request, media_type: str, tmdb_id: str):
     """
     提供特定内容的元数据。
     """
-    return await get_meta(request, media_type, tmdb_id)
\ No newline at end of file
+    config = _user_config(request)
+    key = _meta_key(request, config, media_type, tmdb_id)
+    return await cached_json(request, key, META_TTL, lambda: get_meta(request, media_type, tmdb_id, config))
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Prometheus 文本格式的指标, 以及按请求记录上游调用的追踪。
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+
+# 延迟直方图的桶边界 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Gauge:
+    """
+    可以直接设置数值, 也可以传入 function 在采集时读取当前值。
+    """
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.function = function
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        values = self.function() if self.function else self._values
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # 标签 -> [各桶计数 (非累计), 总和, 总数]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                label_str = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {total}"
+            yield f"{self.name}_count{label_str} {count}"
+
+def render():
+    """
+    以 Prometheus 文本格式导出所有指标。
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+def _executor_queue_depth():
+    # asyncio.to_thread 使用的默认线程池中排队等待的任务数 (读取的是 CPython 的内部属性)
+    try:
+        executor = asyncio.get_running_loop()._default_executor
+    except (RuntimeError, AttributeError):
+        return {(): 0}
+    queue = getattr(executor, "_work_queue", None)
+    return {(): queue.qsize() if queue is not None else 0}
+
+ROUTE_LATENCY = Histogram("stremio_http_request_duration_seconds", "插件路由的处理耗时", ("route", "status"))
+TMDB_LATENCY = Histogram("tmdb_request_duration_seconds", "每次 TMDB 上游请求的耗时", ("endpoint", "status"))
+TMDB_INFLIGHT = Gauge("tmdb_inflight_requests", "正在进行的 TMDB 上游请求数")
+TMDB_RATE_LIMITED = Counter("tmdb_rate_limited_total", "TMDB 返回 429 的次数", ("endpoint",))
+CACHE_REQUESTS = Counter("cache_requests_total", "缓存查询次数", ("cache", "result"))
+EXECUTOR_QUEUE = Gauge("executor_queue_depth", "默认线程池中排队的任务数", function=_executor_queue_depth)
+
+# 当前请求的上游调用记录, 仅在请求开启追踪时为列表
+_trace = ContextVar("upstream_trace", default=None)
+
+def start_trace():
+    """
+    为当前请求开启追踪, 返回用于收集上游调用记录的列表。
+    """
+    calls = []
+    _trace.set(calls)
+    return calls
+
+def stop_trace():
+    """
+    在当前上下文中停止追踪, 用于不属于当前请求的后台任务。
+    """
+    _trace.set(None)
+
+def record_upstream(endpoint, status, started):
+    """
+    记录一次上游请求的指标; 当前请求开启了追踪时同时加入追踪记录。
+    """
+    duration = time.perf_counter() - started
+    TMDB_LATENCY.observe(duration, endpoint, status)
+    if status == 429:
+        TMDB_RATE_LIMITED.inc(endpoint)
+    calls = _trace.get()
+    if calls is not None:
+        calls.append(f"GET {endpoint} {status} {duration * 1000:.1f}ms")
+
+def format_trace(calls):
+    return ", ".join(calls) if calls else "none"
@@ -0,0 +1,78 @@
+"""
+缓存中使用的紧凑记录类型。
+
+TMDB 的列表和分季响应包含大量用不到的字段 (genre_ids、original_title、popularity、crew、guest_stars 等),
+这里只保留渲染 Stremio 响应需要的字段, 使用 __slots__ 避免每个对象携带 __dict__,
+并对重复出现的短字符串 (媒体类型、日期) 做驻留, 以便在同样的内存中缓存更多页面和分季。
+"""
+import sys
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class MediaItem:
+    """
+    目录或搜索结果中的一项, 字段与 _to_stremio_meta_preview 的需要一一对应。
+    """
+    __slots__ = ("id", "media_type", "name", "release_date", "poster_path", "overview", "vote_average")
+
+    def __init__(self, id, media_type, name, release_date=None, poster_path=None, overview=None, vote_average=None):
+        self.id = id
+        self.media_type = media_type
+        self.name = name
+        self.release_date = release_date
+        self.poster_path = poster_path
+        self.overview = overview
+        self.vote_average = vote_average
+
+    def __reduce__(self):
+        # 以元组形式序列化, 二级缓存中不必为每个对象重复写入字段名
+        return (MediaItem, (self.id, self.media_type, self.name, self.release_date, self.poster_path, self.overview, self.vote_average))
+
+    @classmethod
+    def from_tmdb(cls, item, media_type=None):
+        """
+        由 TMDB 列表结果创建; 结果中没有 media_type 时 (例如 discover) 使用传入的 media_type。
+        """
+        media_type = item.get('media_type') or media_type
+        is_movie = media_type == 'movie'
+        return cls(
+            item.get('id'),
+            _intern(media_type),
+            item.get('title') if is_movie else item.get('name'),
+            _intern(item.get('release_date') if is_movie else item.get('first_air_date')),
+            item.get('poster_path'),
+            item.get('overview'),
+            item.get('vote_average'),
+        )
+
+class Episode:
+    """
+    单集中与语言无关的信息 (编号、播出日期、剧照), 所有语言共用。
+    标题和简介按语言单独缓存, 参见 episode_texts。
+    """
+    __slots__ = ("season", "episode", "air_date", "still_path")
+
+    def __init__(self, season, episode, air_date=None, still_path=None):
+        self.season = season
+        self.episode = episode
+        self.air_date = air_date
+        self.still_path = still_path
+
+    def __reduce__(self):
+        return (Episode, (self.season, self.episode, self.air_date, self.still_path))
+
+    @classmethod
+    def from_tmdb(cls, episode):
+        return cls(
+            episode.get('season_number'),
+            episode.get('episode_number'),
+            _intern(episode.get('air_date')),
+            episode.get('still_path'),
+        )
+
+def episode_texts(episodes):
+    """
+    返回一季分集的本地化文本: {集数: (标题, 简介)}。
+    """
+    return {episode.get('episode_number'): (episode.get('name'), episode.get('overview')) for episode in episodes}
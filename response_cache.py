@@ -0,0 +1,139 @@
+import hashlib
+import json
+import re
+from fastapi import Response
+from cache import LRUCache, TieredCache, cache
+from circuit_breaker import track_degraded
+from config import RESPONSE_CACHE_MAX_ENTRIES
+from singleflight import SingleFlight
+
+# 安装了 orjson 时用它序列化响应 (比标准库快数倍), 否则退回标准库 json, 两者都输出紧凑的 UTF-8 JSON
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 允许 CDN 在后台重新验证期间继续提供过期响应的时间 (秒)
+STALE_WHILE_REVALIDATE = 3600
+# 空结果 (通常是上游出错) 和降级响应只允许客户端短暂缓存, 且不在服务端缓存
+EMPTY_MAX_AGE = 60
+STALE_MAX_AGE = 30
+
+# 响应状态: 正常、空结果、降级 (构建时上游出错, 内容可能过期或不完整)
+FRESH = "fresh"
+EMPTY = "empty"
+STALE = "stale"
+
+# 已序列化的响应: 路由键 -> (响应体, ETag)。与 TMDB 缓存共用二级后端, 多个 worker 进程可以共享
+_rendered = TieredCache(LRUCache(RESPONSE_CACHE_MAX_ENTRIES), cache.backend, name="response")
+_rendering = SingleFlight()
+
+# 序列化时代替 JSONFragment 的占位字符串, NUL 字符不会出现在正常的文本中
+_FRAGMENT_PLACEHOLDER = re.compile(rb'"\\u0000fragment:(\d+)"')
+
+class JSONFragment:
+    """
+    已序列化的 JSON 值 (字节串), 由 dumps 原样嵌入到输出中而不再重新编码。
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+def _encode(content, default):
+    if orjson is not None:
+        return orjson.dumps(content, default=default)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+def dumps(content):
+    """
+    将内容序列化为紧凑的 UTF-8 JSON 字节串, 其中的 JSONFragment 原样嵌入。
+    """
+    fragments = []
+
+    def default(value):
+        if isinstance(value, JSONFragment):
+            fragments.append(value.data)
+            return f"\x00fragment:{len(fragments) - 1}"
+        raise TypeError(f"无法序列化 {type(value).__name__} 类型的对象")
+
+    body = _encode(content, default)
+    if fragments:
+        body = _FRAGMENT_PLACEHOLDER.sub(lambda match: fragments[int(match.group(1))], body)
+    return body
+
+def render_json(content):
+    """
+    将响应内容序列化为 JSON 字节串, 并返回 (响应体, ETag)。
+    """
+    body = dumps(content)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return body, etag
+
+def cache_control(ttl):
+    """
+    返回允许客户端和 CDN 缓存 ttl 秒的 Cache-Control 头。
+    """
+    return f"public, max-age={ttl}, stale-while-revalidate={STALE_WHILE_REVALIDATE}"
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+async def _build(key, ttl, build):
+    degraded = track_degraded()
+    content = await build()
+    if degraded:
+        # 上游出错时优先返回最后一次正常构建的响应; 没有时返回本次 (可能不完整的) 结果, 两者都不写入缓存
+        last_good = _rendered.get_stale(f"response:{key}")
+        if last_good is not None:
+            body, etag = last_good
+            return body, etag, STALE
+        body, etag = render_json(content)
+        return body, etag, STALE if any(content.values()) else EMPTY
+    body, etag = render_json(content)
+    # 不缓存空结果, 以免上游的临时故障被长时间缓存
+    if not any(content.values()):
+        return body, etag, EMPTY
+    await _rendered.set(f"response:{key}", (body, etag), ttl)
+    return body, etag, FRESH
+
+def json_response(request, body, etag, cache_control_header, stale=False):
+    """
+    用已序列化的响应体构造响应, If-None-Match 命中时返回 304。
+    stale 为 True 时添加 Warning 响应头, 表明内容可能已经过期。
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control_header}
+    if stale:
+        headers["Warning"] = '110 - "Response is Stale"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def cached_body(key, ttl, build):
+    """
+    返回按路由键缓存的 (响应体, ETag, 状态), 状态为 FRESH、EMPTY 或 STALE。
+    build 是返回响应内容 (dict) 的协程函数, 仅在缓存未命中时调用, 并发的相同请求共享一次构建。
+    """
+    entry = await _rendered.get(f"response:{key}")
+    if entry is not None:
+        body, etag = entry
+        return body, etag, FRESH
+    return await _rendering.do(key, lambda: _build(key, ttl, build))
+
+async def cached_json(request, key, ttl, build):
+    """
+    返回按路由键缓存的 JSON 响应 (参见 cached_body)。
+    响应带有基于内容哈希的 ETag, If-None-Match 命中时返回 304。
+    """
+    body, etag, status = await cached_body(key, ttl, build)
+    if status == FRESH:
+        return json_response(request, body, etag, cache_control(ttl))
+    if status == STALE:
+        return json_response(request, body, etag, f"public, max-age={STALE_MAX_AGE}", stale=True)
+    return json_response(request, body, etag, f"public, max-age={EMPTY_MAX_AGE}")
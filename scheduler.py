@@ -0,0 +1,167 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+import httpx
+from config import TMDB_RATE_LIMIT, TMDB_RATE_BURST, TMDB_MAX_RETRIES, WEB_CONCURRENCY
+from metrics import Gauge
+
+# 优先级通道: 数值越小越优先。交互请求 (搜索、详情、目录) 总是先于后台预取获得令牌
+INTERACTIVE = 0
+BACKGROUND = 1
+_LANES = (INTERACTIVE, BACKGROUND)
+
+# 重试退避的基准时间和上限 (秒)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+
+_current_lane = ContextVar("tmdb_lane", default=INTERACTIVE)
+
+@contextmanager
+def lane(priority):
+    """
+    在当前上下文中以指定优先级发出 TMDB 请求, 例如 `with lane(BACKGROUND): ...`。
+    """
+    token = _current_lane.set(priority)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def current_lane():
+    return _current_lane.get()
+
+class Priority:
+    """
+    一次上游请求的优先级。合并的请求 (参见 SingleFlight) 按创建者的通道发出,
+    更高优先级的调用者加入时通过 promote 提升, 令牌桶中正在等待的请求随之换到更高的通道。
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value=INTERACTIVE):
+        self.value = value
+
+    def promote(self, value):
+        self.value = min(self.value, value)
+
+def _retry_after(response):
+    """
+    解析 Retry-After 响应头 (秒数或 HTTP 日期), 无法解析时返回 None。
+    """
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    """
+    带抖动的指数退避: 在 [delay/2, delay] 之间随机取值。
+    """
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+class TokenBucket:
+    """
+    令牌桶限流器, 按优先级通道分配令牌: 有更高优先级的请求在等待时, 低优先级请求不会拿到令牌。
+    收到 429 时可以暂停发放令牌, 直到 Retry-After 指定的时间。
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = {priority: 0 for priority in _LANES}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def waiting(self, priority):
+        return self._waiting[priority]
+
+    async def acquire(self, priority=INTERACTIVE):
+        """
+        等待并取得一个令牌。priority 可以是通道编号或 Priority, 后者在等待期间被提升时立即生效。
+        """
+        if not isinstance(priority, Priority):
+            priority = Priority(priority)
+        current = priority.value
+        self._waiting[current] += 1
+        try:
+            while True:
+                if priority.value != current:
+                    self._waiting[current] -= 1
+                    current = priority.value
+                    self._waiting[current] += 1
+                now = time.monotonic()
+                self._refill(now)
+                blocked = any(self._waiting[p] for p in _LANES if p < current)
+                if now >= self._paused_until and self._tokens >= 1 and not blocked:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.01)
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[current] -= 1
+
+class Scheduler:
+    """
+    所有 TMDB 请求的统一出口: 先从令牌桶获取令牌, 遇到 429、5xx 或网络错误时
+    按 Retry-After 或带抖动的指数退避重试, 接近配额时请求会排队而不是直接失败。
+    """
+    def __init__(self, rate, burst, max_retries):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+
+    async def send(self, send, priority=None):
+        """
+        send 是发出一次请求并返回 httpx.Response 的协程函数。priority 默认使用当前上下文的通道。
+        重试次数用尽后, 返回最后一次响应或抛出最后一次网络错误。
+        """
+        if priority is None:
+            priority = Priority(_current_lane.get())
+        attempt = 0
+        while True:
+            await self.bucket.acquire(priority)
+            try:
+                response = await send()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = _backoff(attempt)
+            else:
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = _backoff(attempt)
+                if response.status_code == 429:
+                    # 429 说明整体配额已用尽, 按 Retry-After 的完整时长暂停所有通道而不只是当前请求
+                    self.bucket.pause(delay)
+                # 当前请求自身最多等待 BACKOFF_CAP 秒, 之后仍会在令牌桶中等到暂停结束
+                delay = min(delay, BACKOFF_CAP)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+# 限流额度由同一主机上的所有 worker 进程平分
+scheduler = Scheduler(TMDB_RATE_LIMIT / WEB_CONCURRENCY, max(TMDB_RATE_BURST // WEB_CONCURRENCY, 1), TMDB_MAX_RETRIES)
+
+Gauge("tmdb_scheduler_waiting_requests", "在限流器中等待令牌的请求数", ("lane",), function=lambda: {
+    ("interactive",): scheduler.bucket.waiting(INTERACTIVE),
+    ("background",): scheduler.bucket.waiting(BACKGROUND),
+})
@@ -0,0 +1,33 @@
+import asyncio
+
+class SingleFlight:
+    """
+    合并并发的相同请求: 同一个键在执行期间只会运行一次, 其余调用者共享同一个结果。
+    """
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 标记异常已被读取, 避免所有调用者都被取消时出现 "never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn):
+        """
+        执行 fn() 并返回结果; 若同一个键已有进行中的调用, 则等待并共享它的结果。
+        共享的任务不会因为某个调用者被取消而中断。
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
@@ -0,0 +1,185 @@
+"""
+进程内缓存的磁盘快照, 用于重启或发布后快速恢复热数据。
+
+关闭时和运行期间定期把各个 TieredCache 的进程内条目 (TMDB 响应、类型列表、已序列化的目录和 meta)
+写入一个快照文件; 启动时通过 mmap 打开快照, 只读取索引, 条目在第一次被查询时才反序列化并放回 LRU。
+后台任务定期清理索引中已过期的条目, 全部加载或过期后释放 mmap。
+
+文件格式: 文件头 (魔数, 索引偏移), 各条目 pickle 后的值, 最后是 pickle 后的索引
+{缓存名称: {键: (过期时间, 偏移, 长度)}}。
+"""
+import asyncio
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from cache import CACHES
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STRMSNP1"
+_HEADER = struct.Struct("<8sQ")
+
+# 清理快照索引中过期条目的间隔 (秒)
+REVALIDATE_INTERVAL = 60
+
+# 被取消的定期写入仍会在线程中执行完, 用锁避免它与关闭时的写入同时写同一个临时文件
+_write_lock = threading.Lock()
+
+class Snapshot:
+    """
+    通过 mmap 只读打开的快照。每个条目只会被加载一次, 加载、过期或被新值覆盖后从索引中移除。
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} 不是缓存快照文件")
+        self._index = pickle.loads(self._mmap[index_offset:])
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._index.values())
+
+    def pop(self, name, key):
+        """
+        取出并反序列化一个条目, 返回 (过期时间, 值); 不存在、已过期或无法解析时返回 None。
+        """
+        entry = self._index.get(name, {}).pop(key, None)
+        if entry is None:
+            return None
+        expires_at, offset, length = entry
+        if expires_at <= time.time():
+            return None
+        try:
+            return expires_at, pickle.loads(self._mmap[offset:offset + length])
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning(f"解析快照条目时发生错误: {e}")
+            return None
+
+    def discard(self, name, key):
+        self._index.get(name, {}).pop(key, None)
+
+    def entries(self, name):
+        """
+        返回尚未加载的条目: [(键, 过期时间, pickle 后的值)], 写入新快照时原样复制, 不需要反序列化。
+        """
+        return [(key, expires_at, self._mmap[offset:offset + length])
+                for key, (expires_at, offset, length) in self._index.get(name, {}).items()]
+
+    def purge_expired(self):
+        """
+        从索引中移除已过期的条目, 返回剩余的条目数。
+        """
+        now = time.time()
+        for entries in self._index.values():
+            for key in [key for key, (expires_at, _, _) in entries.items() if expires_at <= now]:
+                del entries[key]
+        return len(self)
+
+    def close(self):
+        self._index = {}
+        self._mmap.close()
+
+def load_snapshot(path):
+    """
+    打开快照并挂到各个缓存上, 条目在查询时按需加载。未配置、文件不存在或无效时返回 None。
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError) as e:
+        logger.warning(f"加载缓存快照时发生错误: {e}")
+        return None
+    for tiered in CACHES.values():
+        tiered.snapshot = snapshot
+    logger.info(f"已从 {path} 恢复 {len(snapshot)} 个缓存条目")
+    return snapshot
+
+def close_snapshot(snapshot):
+    """
+    从各个缓存上卸下快照并释放 mmap。
+    """
+    for tiered in CACHES.values():
+        if tiered.snapshot is snapshot:
+            tiered.snapshot = None
+    snapshot.close()
+
+async def revalidate_snapshot(snapshot):
+    """
+    后台任务: 定期清理快照中已过期的条目, 所有条目都已加载或过期后释放快照。
+    """
+    while True:
+        await asyncio.sleep(REVALIDATE_INTERVAL)
+        if not snapshot.purge_expired():
+            close_snapshot(snapshot)
+            return
+
+def _collect():
+    # 在事件循环中复制条目列表, 之后在线程中序列化, 避免遍历时缓存被修改
+    now = time.time()
+    collected = []
+    for name, tiered in CACHES.items():
+        keys = set()
+        for key, expires_at, value in tiered.memory.entries():
+            if expires_at > now:
+                keys.add(key)
+                collected.append((name, key, expires_at, value, None))
+        if tiered.snapshot is not None:
+            for key, expires_at, data in tiered.snapshot.entries(name):
+                if expires_at > now and key not in keys:
+                    collected.append((name, key, expires_at, None, data))
+    return collected
+
+def _write(path, collected):
+    with _write_lock:
+        return _write_locked(path, collected)
+
+def _write_locked(path, collected):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # 多个 worker 可能同时写入同一个快照, 各自写临时文件后原子替换
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    index = {}
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, 0))
+        for name, key, expires_at, value, data in collected:
+            if data is None:
+                try:
+                    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    continue
+            index.setdefault(name, {})[key] = (expires_at, f.tell(), len(data))
+            f.write(data)
+        index_offset = f.tell()
+        f.write(pickle.dumps(index, pickle.HIGHEST_PROTOCOL))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, index_offset))
+    os.replace(tmp_path, path)
+    return sum(len(entries) for entries in index.values())
+
+async def save_snapshot(path):
+    """
+    把各个缓存中未过期的条目写入快照文件, 返回写入的条目数; 写入失败时只记录错误。
+    """
+    try:
+        count = await asyncio.to_thread(_write, path, _collect())
+    except OSError as e:
+        logger.warning(f"写入缓存快照时发生错误: {e}")
+        return 0
+    logger.info(f"已写入 {count} 个缓存条目到 {path}")
+    return count
+
+async def save_snapshot_periodically(path, interval):
+    """
+    后台任务: 每隔 interval 秒写入一次快照。
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await save_snapshot(path)
@@ -1,19 +1,63 @@
-from fastapi.responses import JSONResponse
+from tmdb_index import index as local_index, normalize_text
 from tmdb import (
-    get_meta as tmdb_get_meta, get_season_episodes, get_genres, discover_media,
-    search_media, get_credits, search_person,
+    get_meta as tmdb_get_meta, get_series_episodes, get_genres, discover_media,
+    search_media, search_person,
     get_person_combined_credits
 )
 from config import PLUGIN_ID, PLUGIN_NAME, PLUGIN_VERSION, PLUGIN_DESCRIPTION
+from cache import LRUCache
+from records import MediaItem
+from user_config import DEFAULT_CONFIG
+from metrics import CACHE_REQUESTS, stop_trace
+from response_cache import render_json, dumps, JSONFragment
+from scheduler import lane, BACKGROUND
+from circuit_breaker import mark_degraded, is_degraded
 import asyncio
+import re
 from datetime import datetime, timezone
 from urllib.parse import quote
 
 # 缓存和常量
-GENRE_CACHE = {}
 SORT_OPTIONS = ["热门", "评分", "发行日期"]
 YEARS = [str(year) for year in range(datetime.now().year, 1979, -1)]
 
+# 语言 -> {媒体类型: {类型名称: TMDB 类型 ID}}, 由 _refresh_genres 更新, 获取失败时保留上一次的结果。
+# 只保留最近使用的 GENRE_LANGUAGES_MAX 种语言, 过期后在下次使用时重新获取;
+# 有类型列表获取失败时只保留 GENRE_IDS_RETRY_TTL 秒, 之后的请求会重新获取
+GENRE_LANGUAGES_MAX = 32
+GENRE_IDS_TTL = 24 * 3600
+GENRE_IDS_RETRY_TTL = 60
+GENRE_IDS = LRUCache(GENRE_LANGUAGES_MAX)
+# 预先序列化的默认配置的 manifest: (响应体, ETag)
+MANIFEST = None
+
+# 启动时预热的首页目录: (媒体类型, 目录 ID)
+WARMUP_CATALOGS = [("movie", "tmdb-popular"), ("movie", "tmdb-top-rated"), ("series", "tmdb-popular"), ("series", "tmdb-top-rated")]
+
+# manifest 的刷新间隔 (秒): 成功后每 6 小时刷新一次, 获取类型失败时 1 分钟后重试
+MANIFEST_REFRESH_INTERVAL = 6 * 3600
+MANIFEST_RETRY_INTERVAL = 60
+
+# TMDB 每页固定返回 20 条结果, 目录也按 20 条一页返回给 Stremio
+PAGE_SIZE = 20
+# 搜索: 人物和标题两路并行, 超过 SEARCH_TIMEOUT 秒仍未完成的一路会被取消;
+# 规范化后的查询结果在进程内缓存 SEARCH_CACHE_TTL 秒
+SEARCH_TIMEOUT = 3.0
+SEARCH_CACHE_TTL = 5 * 60
+_search_cache = LRUCache(1000)
+
+# 每季分集序列化后的 JSON 片段: (剧集 ID, 季度编号, 语言) -> (分集列表, 分集文本, 片段)。
+# 分集列表和文本来自 TMDB 缓存, 只要缓存中仍是同样的对象, 片段就无需重新生成
+SEASON_FRAGMENT_TTL = 6 * 3600
+_season_fragments = LRUCache(2000)
+
+# meta 请求接受的 ID: tmdb:123、123 或 IMDb ID (tt123), 其它 ID 不请求 TMDB。
+# 必须用 fullmatch 匹配整个 ID ("$" 会放过末尾的换行), 并且只接受 ASCII 数字
+META_ID_PATTERN = re.compile(r"tmdb:\d+|\d+|tt\d+", re.ASCII)
+
+# 正在运行的后台预取任务, 保留引用以免被垃圾回收
+_background_tasks = set()
+
 def format_to_iso(date_str):
     if not date_str: return None
     try:
@@ -23,21 +67,35 @@ def format_to_iso(date_str):
     except (ValueError, TypeError):
         return None
 
-async def get_manifest():
-    if "movie_genres" not in GENRE_CACHE: GENRE_CACHE["movie_genres"] = get_genres("movie")
-    if "series_genres" not in GENRE_CACHE: GENRE_CACHE["series_genres"] = get_genres("tv")
-
-    movie_genres = [genre['name'] for genre in GENRE_CACHE["movie_genres"]]
-    series_genres = [genre['name'] for genre in GENRE_CACHE["series_genres"]]
+def _genre_ids(language):
+    return GENRE_IDS.get_stale(language) or {"movie": {}, "series": {}}
+
+async def _refresh_genres(language):
+    """
+    并行获取 language 语言的电影和剧集类型列表并更新 GENRE_IDS, 返回两份类型列表是否都获取成功。
+    """
+    movie_genres, series_genres = await asyncio.gather(get_genres("movie", language), get_genres("tv", language))
+    genre_ids = dict(_genre_ids(language))
+    if movie_genres:
+        genre_ids["movie"] = {genre['name']: genre['id'] for genre in movie_genres}
+    if series_genres:
+        genre_ids["series"] = {genre['name']: genre['id'] for genre in series_genres}
+    ok = bool(movie_genres and series_genres)
+    GENRE_IDS.set(language, genre_ids, GENRE_IDS_TTL if ok else GENRE_IDS_RETRY_TTL)
+    return ok
+
+def _build_manifest(config=DEFAULT_CONFIG):
+    movie_genres = list(_genre_ids(config.language)["movie"])
+    series_genres = list(_genre_ids(config.language)["series"])
 
     movie_extra_discover = [
-        {"name": "排序", "options": ["热门", "评分", "发行日期"], "isRequired": False},
+        {"name": "排序", "options": SORT_OPTIONS, "isRequired": False},
         {"name": "类型", "options": movie_genres, "isRequired": False},
         {"name": "年份", "options": YEARS, "isRequired": False},
         {"name": "skip"}
     ]
     series_extra_discover = [
-        {"name": "排序", "options": ["热门", "评分", "发行日期"], "isRequired": False},
+        {"name": "排序", "options": SORT_OPTIONS, "isRequired": False},
         {"name": "类型", "options": series_genres, "isRequired": False},
         {"name": "年份", "options": YEARS, "isRequired": False},
         {"name": "skip"}
@@ -59,6 +117,7 @@ async def get_manifest():
         {"type": "series", "id": "tmdb-search", "name": "剧集搜索", "extra": [{"name": "search", "isRequired": True}]}
     ]
     catalogs.extend(search_catalogs)
+    catalogs = [catalog for catalog in catalogs if config.shows(catalog["type"], catalog["id"])]
 
     return {
         "id": PLUGIN_ID, "version": "1.1.0", "name": PLUGIN_NAME, "description": PLUGIN_DESCRIPTION,
@@ -66,14 +125,60 @@ async def get_manifest():
         "catalogs": catalogs
     }
 
+async def refresh_manifest():
+    """
+    更新默认语言的类型映射并重新序列化默认配置的 manifest。
+    获取失败的类型列表保留上一次的结果。返回两份类型列表是否都获取成功。
+    """
+    global MANIFEST
+    ok = await _refresh_genres(DEFAULT_CONFIG.language)
+    MANIFEST = render_json(_build_manifest())
+    return ok
+
+async def refresh_manifest_periodically(ok):
+    """
+    后台任务: 定期刷新 manifest, 上一次获取失败时更快地重试。
+    """
+    while True:
+        await asyncio.sleep(MANIFEST_REFRESH_INTERVAL if ok else MANIFEST_RETRY_INTERVAL)
+        ok = await refresh_manifest()
+
+async def warm_up():
+    """
+    启动预热: 构建 manifest, 并获取首页各目录的第一页写入缓存。返回类型列表是否获取成功。
+    """
+    catalogs = (get_catalog(None, media_type, catalog_id) for media_type, catalog_id in WARMUP_CATALOGS)
+    ok, *_ = await asyncio.gather(refresh_manifest(), *catalogs)
+    return ok
+
+def manifest_ready():
+    """
+    返回默认配置的 manifest 是否已经构建 (启动预热是否已经获取过类型列表)。
+    """
+    return MANIFEST is not None
+
+def get_manifest():
+    """
+    返回预先序列化的默认配置的 manifest: (响应体, ETag)。尚未构建时返回不含类型列表的占位版本。
+    """
+    if MANIFEST is None:
+        return render_json(_build_manifest())
+    return MANIFEST
+
+async def build_manifest(config):
+    """
+    构建自定义配置的 manifest (dict), 类型列表使用配置的语言。
+    """
+    if config.language != DEFAULT_CONFIG.language:
+        await _refresh_genres(config.language)
+    return _build_manifest(config)
+
 def _to_stremio_meta_preview(request, item, media_type):
-    tmdb_item_type = item.get('media_type', 'tv' if media_type == 'series' else 'movie')
-    release_date_key = 'release_date' if tmdb_item_type == 'movie' else 'first_air_date'
-    release_date = item.get(release_date_key)
+    # item 是 MediaItem, 名称和日期已按电影/剧集取好
+    release_date = item.release_date
     year = release_date.split('-')[0] if release_date else None
-    name = item.get('title') if tmdb_item_type == 'movie' else item.get('name')
-    rating = item.get('vote_average')
-    overview = item.get('overview')
+    rating = item.vote_average
+    overview = item.overview
 
     description_parts = []
     # if rating:
@@ -83,39 +188,26 @@ def _to_stremio_meta_preview(request, item, media_type):
     formatted_description = "\n\n".join(description_parts)
 
     return {
-        "id": f"tmdb:{item.get('id')}",
+        "id": f"tmdb:{item.id}",
         "type": media_type,
-        "name": name,
-        "poster": f"https://image.tmdb.org/t/p/w500{item.get('poster_path')}" if item.get('poster_path') else None,
+        "name": item.name,
+        "poster": f"https://image.tmdb.org/t/p/w500{item.poster_path}" if item.poster_path else None,
         "description": formatted_description,
         "releaseInfo": year,
         "imdbRating": f"{rating:.1f}" if rating else None,
     }
 
-async def get_catalog(request, media_type, catalog_id, extra_args=None):
+async def get_catalog(request, media_type, catalog_id, extra_args=None, config=DEFAULT_CONFIG):
     tmdb_type = 'tv' if media_type == 'series' else 'movie'
     extra_args = extra_args or {}
-    page = int(extra_args.get("skip", 0)) // 20 + 1
+    skip = int(extra_args.get("skip", 0))
+    page = skip // PAGE_SIZE + 1
     search_query = extra_args.get("search")
 
     if catalog_id == 'tmdb-search' and search_query:
-        items = []
-        person_id = await asyncio.to_thread(search_person, search_query)
-
-        if person_id:
-            all_works = await asyncio.to_thread(get_person_combined_credits, person_id)
-            if all_works:
-                person_works = [work for work in all_works if work.get('media_type') == tmdb_type]
-                if person_works:
-                    items.extend(person_works)
-
-        if not items:
-            title_results = await asyncio.to_thread(search_media, search_query, page)
-            items.extend([item for item in title_results if item.get('media_type') == tmdb_type])
-
-        items.sort(key=lambda x: x.get('vote_average') or 0, reverse=True)
+        items = await _search(normalize_text(search_query), tmdb_type, page, config)
         metas = [_to_stremio_meta_preview(request, item, media_type) for item in items]
-        return JSONResponse(content={"metas": metas})
+        return {"metas": metas}
 
     sort_by = "popular"
     if "top-rated" in catalog_id:
@@ -129,33 +221,126 @@ async def get_catalog(request, media_type, catalog_id, extra_args=None):
 
     genre_name = extra_args.get("类型")
     year = extra_args.get("年份")
-    genre_id = None
-    if genre_name:
-        genre_list = GENRE_CACHE.get(f"{media_type}_genres", [])
-        for genre in genre_list:
-            if genre['name'] == genre_name:
-                genre_id = genre['id']
-                break
-
-    items = await asyncio.to_thread(discover_media, tmdb_type, genre_id, sort_by, year, page)
+    if genre_name and GENRE_IDS.get(config.language) is None:
+        # 重启后尚未构建过该语言的 manifest 时, 先获取类型列表 (通常命中 TMDB 缓存)
+        await _refresh_genres(config.language)
+    genre_id = _genre_ids(config.language).get(media_type, {}).get(genre_name) if genre_name else None
+    if genre_name and genre_id is None:
+        # 不能忽略类型筛选而返回未筛选的列表: 类型列表获取失败时标记为降级 (不缓存), 未知的类型返回空结果
+        if not _genre_ids(config.language).get(media_type):
+            mark_degraded("error:genres")
+        return {"metas": []}
+
+    items = await _fetch_window(
+        lambda page: discover_media(tmdb_type, genre_id, sort_by, year, page, config.language, config.region, config.adult), skip
+    )
     metas = [_to_stremio_meta_preview(request, item, media_type) for item in items]
-    return JSONResponse(content={"metas": metas})
-
-def _to_stremio_videos(episodes, series_id):
+    return {"metas": metas}
+
+async def _search_person_works(query, config):
+    person_id = await search_person(query, config.adult)
+    if not person_id:
+        return []
+    return await get_person_combined_credits(person_id, config.language)
+
+async def _search(query, tmdb_type, page, config=DEFAULT_CONFIG):
+    """
+    同时按人物和标题搜索, 合并去重后按评分排序。
+    超时未完成的一路会被取消, 只使用已完成的结果, 此时响应标记为降级, 结果不进入查询缓存。
+    配置了本地索引时, 标题搜索没有结果 (超时或出错) 则使用本地索引的结果。
+    """
+    key = (query, tmdb_type, page, config.language, config.adult)
+    cached = _search_cache.get(key)
+    CACHE_REQUESTS.inc("search", "miss" if cached is None else "memory_hit")
+    if cached is not None:
+        return cached
+
+    person_task = asyncio.create_task(_search_person_works(query, config))
+    title_task = asyncio.create_task(search_media(query, page, config.language, config.adult))
+    done, pending = await asyncio.wait({person_task, title_task}, timeout=SEARCH_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    if pending:
+        mark_degraded("timeout:search")
+
+    merged = {}
+    for task in (person_task, title_task):
+        if task in done:
+            for item in task.result():
+                if item.media_type == tmdb_type:
+                    merged.setdefault(item.id, item)
+    if local_index is not None and page == 1 and not (title_task in done and title_task.result()):
+        for hit in local_index.search(query, tmdb_type, PAGE_SIZE):
+            merged.setdefault(hit['id'], MediaItem(hit['id'], hit['media_type'], hit['title']))
+    items = sorted(merged.values(), key=lambda x: x.vote_average or 0, reverse=True)
+
+    if items and not is_degraded():
+        _search_cache.set(key, items, SEARCH_CACHE_TTL)
+    return items
+
+def _prefetch(fetch):
+    """
+    在后台以低优先级执行 fetch(), 结果写入 TMDB 缓存供之后的请求使用。
+    """
+    async def run():
+        # 后台任务复制了当前请求的上下文, 它的上游调用不应计入该请求的追踪
+        stop_trace()
+        with lane(BACKGROUND):
+            await fetch()
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def cancel_background_tasks():
+    """
+    取消所有仍在运行的后台预取任务, 在关闭缓存之前调用。
+    """
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _fetch_window(fetch_page, skip):
+    """
+    返回从第 skip 条开始的 PAGE_SIZE 条结果。fetch_page(page) 返回 TMDB 某一页的结果。
+    skip 不是 PAGE_SIZE 的整数倍时拼接相邻的两页; 返回后在后台预取下一页。
+    """
+    first_page, offset = divmod(skip, PAGE_SIZE)
+    pages = [first_page + 1] if offset == 0 else [first_page + 1, first_page + 2]
+    results = await asyncio.gather(*(fetch_page(page) for page in pages))
+    if len(results[-1]) >= PAGE_SIZE:
+        _prefetch(lambda: fetch_page(pages[-1] + 1))
+    items = [item for page_items in results for item in page_items]
+    return items[offset:offset + PAGE_SIZE]
+
+def _to_stremio_videos(episodes, texts, series_id):
     videos = []
     for episode in episodes:
-        video_id = f"{series_id}:{episode.get('season_number')}:{episode.get('episode_number')}"
+        video_id = f"{series_id}:{episode.season}:{episode.episode}"
+        name, overview = texts.get(episode.episode, (None, None))
         videos.append({
-            "id": video_id, "title": episode.get('name'), "season": episode.get('season_number'),
-            "episode": episode.get('episode_number'), "released": format_to_iso(episode.get('air_date')),
-            "overview": episode.get('overview'),
-            "thumbnail": f"https://image.tmdb.org/t/p/w500{episode.get('still_path')}" if episode.get('still_path') else None,
+            "id": video_id, "title": name, "season": episode.season,
+            "episode": episode.episode, "released": format_to_iso(episode.air_date),
+            "overview": overview,
+            "thumbnail": f"https://image.tmdb.org/t/p/w500{episode.still_path}" if episode.still_path else None,
         })
     return videos
 
-def _to_stremio_meta(request, item, credits, media_type):
+def _season_videos_fragment(series_id, number, language, episodes, texts):
+    """
+    返回一季分集序列化后的 JSON 片段 (不含外层方括号的数组元素)。
+    """
+    key = (series_id, number, language)
+    cached = _season_fragments.get(key)
+    if cached is not None and cached[0] is episodes and cached[1] is texts:
+        return cached[2]
+    fragment = dumps(_to_stremio_videos(episodes, texts, series_id))[1:-1]
+    _season_fragments.set(key, (episodes, texts, fragment), SEASON_FRAGMENT_TTL)
+    return fragment
+
+def _to_stremio_meta(request, item, credits, media_type, config=DEFAULT_CONFIG):
     base_url = f"https://{request.url.netloc}"
-    transport_url = f"{base_url}/manifest.json"
+    transport_url = config.manifest_url(base_url)
     imdb_id = item.get('external_ids', {}).get('imdb_id')
     stremio_id = imdb_id if imdb_id else f"tmdb:{item.get('id')}"
     rating = item.get('vote_average')
@@ -206,27 +391,26 @@ def _to_stremio_meta(request, item, credits, media_type):
     }
     return meta
 
-async def get_meta(request, media_type, tmdb_id_str):
+async def get_meta(request, media_type, tmdb_id_str, config=DEFAULT_CONFIG):
+    if not META_ID_PATTERN.fullmatch(tmdb_id_str):
+        return {"meta": {}}
     tmdb_id = tmdb_id_str.replace("tmdb:", "")
     tmdb_type = 'tv' if media_type == 'series' else 'movie'
 
-    meta_info, credits_info = await asyncio.gather(
-        asyncio.to_thread(tmdb_get_meta, tmdb_type, tmdb_id),
-        asyncio.to_thread(get_credits, tmdb_type, tmdb_id)
-    )
-
+    meta_info = await tmdb_get_meta(tmdb_type, tmdb_id, config.language)
     if not meta_info:
-        return JSONResponse(content={"meta": {}})
+        return {"meta": {}}
+    credits_info = meta_info.get('credits')
 
-    stremio_meta = _to_stremio_meta(request, meta_info, credits_info, media_type)
+    stremio_meta = _to_stremio_meta(request, meta_info, credits_info, media_type, config)
 
     if media_type == 'series':
-        all_episodes = []
-        seasons = [s for s in meta_info.get('seasons', []) if s.get('season_number') != 0]
-        tasks = [asyncio.to_thread(get_season_episodes, meta_info.get('id'), season.get('season_number')) for season in seasons]
-        season_results = await asyncio.gather(*tasks)
-        for episodes in season_results:
-            all_episodes.extend(episodes)
-        stremio_meta['videos'] = _to_stremio_videos(all_episodes, stremio_meta['id'])
-
-    return JSONResponse(content={"meta": stremio_meta})
+        # 长篇剧集有成千上万集, 按季拼接缓存的 JSON 片段, 不必每次都构建并序列化全部分集
+        season_episodes = await get_series_episodes(meta_info, config.language)
+        fragments = [
+            _season_videos_fragment(stremio_meta['id'], number, config.language, *season_episodes[number])
+            for number in sorted(season_episodes)
+        ]
+        stremio_meta['videos'] = JSONFragment(b"[" + b",".join(fragment for fragment in fragments if fragment) + b"]")
+
+    return {"meta": stremio_meta}
@@ -0,0 +1,34 @@
+import asyncio
+import os
+import sys
+import httpx
+import pytest
+
+# 项目的模块都在仓库根目录下, 测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import circuit_breaker
+import tmdb
+from cache import LRUCache, TieredCache
+from scheduler import Scheduler
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    把 tmdb 模块接到一个可替换响应的模拟 TMDB 上, 并使用独立的缓存和熔断器。
+    返回状态字典: 可以替换其中的 handler, calls 是上游被调用的次数。
+    """
+    state = {"handler": lambda request: httpx.Response(200, json={"ok": True}), "calls": 0}
+
+    async def handle(request):
+        state["calls"] += 1
+        result = state["handler"](request)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    client = httpx.AsyncClient(base_url="http://tmdb.test/3", transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(tmdb, "get_client", lambda: client)
+    monkeypatch.setattr(tmdb, "cache", TieredCache(LRUCache(100), name="test-tmdb"))
+    monkeypatch.setattr(tmdb, "scheduler", Scheduler(1000, 100, 0))
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    return state
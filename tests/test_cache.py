@@ -0,0 +1,251 @@
+import asyncio
+import pickle
+import time
+import pytest
+import cache as cache_module
+from cache import LRUCache, FileBackend, RedisBackend, TieredCache, CacheBackendError, create_backend, _pack, _unpack, _HEADER
+from records import MediaItem, Episode
+
+class RedisStub:
+    """
+    进程内的最小 RESP 服务, 支持 AUTH、SELECT、GET 和 SET ... PX, 用于代替真实的 Redis。
+    """
+    def __init__(self, password=None, databases=16):
+        self.password = password
+        self.databases = databases
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line.startswith(b"*")
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        authenticated = self.password is None
+        db = 0
+        while True:
+            args = await self._read_command(reader)
+            if args is None:
+                break
+            name = args[0].decode().upper()
+            self.commands.append([name] + args[1:])
+            if name == "AUTH":
+                if args[1].decode() == self.password:
+                    authenticated = True
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"-WRONGPASS invalid username-password pair\r\n")
+            elif not authenticated:
+                writer.write(b"-NOAUTH Authentication required.\r\n")
+            elif name == "SELECT":
+                if int(args[1]) < self.databases:
+                    db = int(args[1])
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"-ERR DB index is out of range\r\n")
+            elif name == "GET":
+                value = self.data.get((db, args[1]))
+                writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+            elif name == "SET":
+                self.data[(db, args[1])] = args[2]
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+def run_with_stub(stub, test):
+    async def main():
+        port = await stub.start()
+        try:
+            await test(port)
+        finally:
+            await stub.stop()
+    asyncio.run(main())
+
+def test_redis_round_trip():
+    stub = RedisStub()
+
+    async def test(port):
+        backend = RedisBackend("127.0.0.1", port)
+        # 值中的 \r\n 不能影响按长度读取的批量字符串
+        await backend.set("k", b"line1\r\nline2\x00", 1.5)
+        assert await backend.get("k") == b"line1\r\nline2\x00"
+        assert await backend.get("missing") is None
+        await backend.close()
+
+    run_with_stub(stub, test)
+    assert stub.commands[0] == ["SET", b"k", b"line1\r\nline2\x00", b"PX", b"1500"]
+    assert stub.connections == 1
+
+def test_redis_auth_and_select():
+    stub = RedisStub(password="secret")
+
+    async def test(port):
+        backend = create_backend(f"redis://:secret@127.0.0.1:{port}/3")
+        await backend.set("k", b"v", 60)
+        assert await backend.get("k") == b"v"
+        await backend.close()
+
+    run_with_stub(stub, test)
+    assert [command[0] for command in stub.commands[:2]] == ["AUTH", "SELECT"]
+    assert stub.data == {(3, b"k"): b"v"}
+
+def test_redis_wrong_password_raises_and_reconnects():
+    stub = RedisStub(password="secret")
+
+    async def test(port):
+        backend = RedisBackend("127.0.0.1", port, password="wrong")
+        with pytest.raises(CacheBackendError, match="WRONGPASS"):
+            await backend.get("k")
+        # 出错后断开连接, 下一次命令重新连接并重新认证
+        backend.password = "secret"
+        assert await backend.get("k") is None
+        await backend.close()
+
+    run_with_stub(stub, test)
+    assert stub.connections == 2
+
+def test_redis_select_failure_raises():
+    stub = RedisStub(databases=1)
+
+    async def test(port):
+        backend = RedisBackend("127.0.0.1", port, db=5)
+        with pytest.raises(CacheBackendError, match="out of range"):
+            await backend.set("k", b"v", 60)
+        await backend.close()
+
+    run_with_stub(stub, test)
+    assert stub.data == {}
+
+def test_redis_unreachable_raises():
+    async def test():
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        with pytest.raises(CacheBackendError):
+            await RedisBackend("127.0.0.1", port).get("k")
+
+    asyncio.run(test())
+
+def test_tiered_cache_backfills_memory_from_backend():
+    stub = RedisStub()
+
+    async def test(port):
+        backend = RedisBackend("127.0.0.1", port)
+        writer = TieredCache(LRUCache(10), backend, name="test-writer")
+        await writer.set("k", {"a": 1}, 60)
+        reader = TieredCache(LRUCache(10), backend, name="test-reader")
+        assert await reader.get("k") == {"a": 1}
+        assert reader.memory.get("k") == {"a": 1}
+        await backend.close()
+
+    run_with_stub(stub, test)
+    assert [command[0] for command in stub.commands] == ["SET", "GET"]
+
+def test_tiered_cache_treats_backend_errors_as_miss():
+    async def test():
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        tiered = TieredCache(LRUCache(10), RedisBackend("127.0.0.1", port), name="test-broken")
+        await tiered.set("k", "v", 60)
+        assert await tiered.get("k") == "v"
+        assert await tiered.get("other") is None
+
+    asyncio.run(test())
+
+def test_lru_evicts_least_recently_used_and_keeps_stale():
+    lru = LRUCache(2)
+    lru.set("a", 1, 60)
+    lru.set("b", 2, 60)
+    lru.get("a")
+    lru.set("c", 3, 60)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    lru.set("a", 1, -1)
+    assert lru.get("a") is None
+    assert lru.get_stale("a") == 1
+
+def test_file_backend_purges_expired_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileBackend, "PURGE_EVERY", 3)
+    backend = FileBackend(str(tmp_path))
+
+    def files():
+        return sorted(path.name for path in tmp_path.rglob("*") if path.is_file())
+
+    async def main():
+        await backend.set("expired", _pack("old", time.time() - 1), 60)
+        await backend.set("fresh", _pack("new", time.time() + 60), 60)
+        (tmp_path / "tmp-in-progress").write_bytes(b"")
+        assert len(files()) == 3
+        # 第 PURGE_EVERY 次写入时清理没有再被读取过的过期文件, 正在写入的临时文件保留
+        await backend.set("another", _pack("new", time.time() + 60), 60)
+        assert len(files()) == 3 and "tmp-in-progress" in files()
+        assert await backend.get("expired") is None
+        assert _unpack(await backend.get("fresh"))[1] == "new"
+
+    asyncio.run(main())
+
+VALUES = [
+    {"results": [1, 2.5, None, True, "文本"], "nested": {"a": []}},
+    [MediaItem(550, "movie", "Fight Club", "1999-10-15", "/p.jpg", "简介", 8.4)],
+    [Episode(1, 2, "2008-01-20", "/s.jpg")],
+    {1: ("标题", "简介"), 2: (None, None)},
+    (b'{"meta":{}}', '"etag"'),
+    b"\xff\x00binary",
+]
+
+def records_as_tuples(value):
+    if isinstance(value, (MediaItem, Episode)):
+        return value.__reduce__()
+    if isinstance(value, list):
+        return [records_as_tuples(item) for item in value]
+    return value
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_pack_round_trips_cached_values(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(cache_module, "orjson", None)
+    for value in VALUES:
+        expires_at, restored = _unpack(_pack(value, 123.5))
+        assert expires_at == 123.5
+        assert type(restored) is type(value)
+        assert records_as_tuples(restored) == records_as_tuples(value)
+
+def test_pack_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        _pack(object(), 0)
+
+def test_backend_entries_are_never_unpickled():
+    # 能写入共享后端的人不能借此在插件进程中执行代码
+    class Exploit:
+        def __reduce__(self):
+            return (exec, ("raise SystemExit('executed')",))
+
+    data = _HEADER.pack(time.time() + 60) + pickle.dumps(Exploit())
+    with pytest.raises(ValueError):
+        _unpack(data)
+    forged = _HEADER.pack(time.time() + 60) + b'{"\\u0000r":["exec",["1"]]}'
+    with pytest.raises(KeyError):
+        _unpack(forged)
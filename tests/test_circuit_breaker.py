@@ -0,0 +1,186 @@
+import asyncio
+import httpx
+import pytest
+import circuit_breaker
+import tmdb
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, track_degraded
+from scheduler import Scheduler
+
+def reply(status=200, json=None):
+    async def send():
+        return httpx.Response(status, json=json if json is not None else {})
+    return send
+
+def fail():
+    async def send():
+        raise httpx.ConnectError("down")
+    return send
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("/test", threshold=3, cooldown=60)
+    calls = []
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(httpx.ConnectError):
+                await breaker.call(fail())
+        assert breaker.state == OPEN
+
+        async def send():
+            calls.append(1)
+            return httpx.Response(200)
+
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(send)
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+    asyncio.run(main())
+    assert calls == []
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("/test", threshold=2, cooldown=60)
+
+    async def main():
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(fail())
+        await breaker.call(reply(200))
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(fail())
+        assert breaker.state == CLOSED
+
+    asyncio.run(main())
+
+def test_server_errors_count_but_client_errors_do_not():
+    breaker = CircuitBreaker("/test", threshold=2, cooldown=60)
+
+    async def main():
+        for _ in range(3):
+            await breaker.call(reply(404))
+        assert breaker.state == CLOSED
+        await breaker.call(reply(500))
+        await breaker.call(reply(503))
+        assert breaker.state == OPEN
+
+    asyncio.run(main())
+
+def test_half_open_allows_a_single_probe_then_closes():
+    breaker = CircuitBreaker("/test", threshold=1, cooldown=0.05)
+
+    async def main():
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(fail())
+        assert breaker.state == OPEN
+        await asyncio.sleep(0.06)
+        assert breaker.state == HALF_OPEN
+
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return httpx.Response(200)
+
+        probing = asyncio.create_task(breaker.call(probe))
+        await asyncio.sleep(0)
+        # 探测请求进行中时, 其余请求直接失败
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(reply(200))
+        release.set()
+        assert (await probing).status_code == 200
+        assert breaker.state == CLOSED
+
+    asyncio.run(main())
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("/test", threshold=3, cooldown=0.05)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(httpx.ConnectError):
+                await breaker.call(fail())
+        await asyncio.sleep(0.06)
+        # 半开状态下一次失败就重新打开, 不需要再累计到阈值
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(fail())
+        assert breaker.state == OPEN
+
+    asyncio.run(main())
+
+def test_cancelled_probe_releases_the_probe_slot():
+    breaker = CircuitBreaker("/test", threshold=1, cooldown=0.05)
+
+    async def main():
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(fail())
+        await asyncio.sleep(0.06)
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        probing = asyncio.create_task(breaker.call(hang))
+        await asyncio.sleep(0)
+        probing.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probing
+        assert breaker.state == HALF_OPEN
+        await breaker.call(reply(200))
+        assert breaker.state == CLOSED
+
+    asyncio.run(main())
+
+def test_queueing_behind_the_rate_limit_does_not_open_the_breaker(upstream, monkeypatch):
+    monkeypatch.setattr(tmdb, "scheduler", Scheduler(20, 1, 0))
+    monkeypatch.setattr(tmdb, "TMDB_REQUEST_DEADLINE", 0.05)
+
+    async def main():
+        # 第 6 个请求要在限流器中排队约 0.25 秒, 远超单次请求的时限, 但 TMDB 一直正常
+        results = await asyncio.gather(*(tmdb._get("/discover/movie", {"page": page}) for page in range(6)))
+        assert results == [{"ok": True}] * 6
+        assert circuit_breaker.get_breaker("/discover/movie").state == CLOSED
+
+    asyncio.run(main())
+
+def test_slow_upstream_times_out_and_opens_the_breaker(upstream, monkeypatch):
+    monkeypatch.setattr(tmdb, "TMDB_REQUEST_DEADLINE", 0.02)
+
+    async def slow(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={})
+
+    upstream["handler"] = slow
+
+    async def main():
+        for tmdb_id in range(circuit_breaker.TMDB_BREAKER_THRESHOLD):
+            with pytest.raises(httpx.TimeoutException):
+                await tmdb._get(f"/movie/{tmdb_id}")
+        assert circuit_breaker.get_breaker("/movie/{id}").state == OPEN
+        calls = upstream["calls"]
+        with pytest.raises(CircuitOpenError):
+            await tmdb._get("/movie/42")
+        assert upstream["calls"] == calls
+
+    asyncio.run(main())
+
+def test_non_json_body_is_an_upstream_error_with_stale_fallback(upstream):
+    async def main():
+        assert await tmdb._get("/genre/movie/list", {"language": "zh-CN"}, ttl=0.01) == {"ok": True}
+        await asyncio.sleep(0.02)
+        upstream["handler"] = lambda request: httpx.Response(200, text="<html>portal</html>")
+        reasons = track_degraded()
+        # 已过期的数据仍可在上游故障时使用, 当前响应被标记为降级
+        assert await tmdb._get("/genre/movie/list", {"language": "zh-CN"}, ttl=60) == {"ok": True}
+        assert reasons == {"stale:/genre/movie/list"}
+        with pytest.raises(httpx.DecodingError):
+            await tmdb._get("/genre/tv/list", {"language": "zh-CN"}, ttl=60)
+        # get_genres 等公开函数把它当作普通的上游错误处理
+        assert await tmdb.get_genres("tv", "en-US") == []
+
+    asyncio.run(main())
+
+def test_endpoint_labels_do_not_depend_on_ids():
+    assert tmdb._endpoint("/movie/abc") == "/movie/{id}"
+    assert tmdb._endpoint("/tv/1399/season/3") == "/tv/{id}/season/{id}"
+    assert tmdb._endpoint("/find/tt0133093") == "/find/{id}"
+    assert tmdb._endpoint("/person/287/combined_credits") == "/person/{id}/combined_credits"
+    assert tmdb._endpoint("/genre/movie/list") == "/genre/movie/list"
+    assert tmdb._endpoint("/discover/tv") == "/discover/tv"
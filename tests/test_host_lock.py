@@ -0,0 +1,37 @@
+import asyncio
+import host_lock as host_lock_module
+import main
+import stremio
+from host_lock import host_lock
+
+def test_non_blocking_lock_reports_whether_it_was_acquired(tmp_path, monkeypatch):
+    monkeypatch.setattr(host_lock_module, "LOCK_DIR", str(tmp_path))
+
+    async def main():
+        async with host_lock("warmup", blocking=False) as first:
+            assert first
+            # flock 按打开的文件区分, 同一进程中再次打开也会被拒绝
+            async with host_lock("warmup", blocking=False) as second:
+                assert not second
+        async with host_lock("warmup", blocking=False) as again:
+            assert again
+
+    asyncio.run(main())
+
+def test_startup_does_not_wait_for_warm_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(host_lock_module, "LOCK_DIR", str(tmp_path))
+    monkeypatch.setattr(stremio, "MANIFEST", None)
+    started = asyncio.Event()
+
+    async def warm_up():
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main, "warm_up", warm_up)
+
+    async def run():
+        async with main.lifespan(main.app):
+            await asyncio.wait_for(started.wait(), 1)
+            assert not stremio.manifest_ready()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
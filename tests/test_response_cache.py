@@ -0,0 +1,56 @@
+import json
+import pytest
+import response_cache
+import stremio
+from records import Episode
+from response_cache import dumps, render_json, JSONFragment
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    # 分别使用 orjson 和标准库 json 序列化, 两者的输出应当一致
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(response_cache, "orjson", None)
+    return request.param
+
+def test_dumps_is_compact_utf8(encoder):
+    assert dumps({"name": "电影", "list": [1, None, True]}) == '{"name":"电影","list":[1,null,true]}'.encode("utf-8")
+
+def test_fragments_are_embedded_verbatim(encoder):
+    content = {
+        "meta": {"name": "剧集", "videos": JSONFragment(b'[{"id":"a"},{"id":"b"}]')},
+        "other": [JSONFragment(b"1"), JSONFragment(b'{"x":"\\u0000fragment:0"}')],
+    }
+    body = dumps(content)
+    assert json.loads(body) == {
+        "meta": {"name": "剧集", "videos": [{"id": "a"}, {"id": "b"}]},
+        "other": [1, {"x": "\x00fragment:0"}],
+    }
+    # 与直接序列化展开后的内容完全相同, ETag 也不受影响
+    assert body == dumps({
+        "meta": {"name": "剧集", "videos": [{"id": "a"}, {"id": "b"}]},
+        "other": [1, {"x": "\x00fragment:0"}],
+    })
+
+def test_unknown_types_are_rejected(encoder):
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+def test_season_fragments_join_into_the_videos_array(encoder, monkeypatch):
+    monkeypatch.setattr(stremio, "_season_fragments", stremio.LRUCache(10))
+    season_1 = [Episode(1, 1, "2008-01-20"), Episode(1, 2, None, "/s.jpg")]
+    texts_1 = {1: ("第 1 集", "简介"), 2: (None, None)}
+    fragments = [
+        stremio._season_videos_fragment("tt1", 1, "zh-CN", season_1, texts_1),
+        # 没有分集的季度得到空片段, 拼接时跳过, 不会产生多余的逗号
+        stremio._season_videos_fragment("tt1", 2, "zh-CN", [], {}),
+    ]
+    assert fragments[1] == b""
+    videos = JSONFragment(b"[" + b",".join(fragment for fragment in fragments if fragment) + b"]")
+    body, etag = render_json({"meta": {"id": "tt1", "videos": videos}})
+    assert json.loads(body)["meta"]["videos"] == stremio._to_stremio_videos(season_1, texts_1, "tt1")
+    assert body == render_json({"meta": {"id": "tt1", "videos": stremio._to_stremio_videos(season_1, texts_1, "tt1")}})[0]
+    # 分集对象没有变化时复用缓存的片段
+    assert stremio._season_videos_fragment("tt1", 1, "zh-CN", season_1, texts_1) is fragments[0]
+    assert json.loads(b"[" + stremio._season_videos_fragment("tt1", 2, "zh-CN", [], {}) + b"]") == []
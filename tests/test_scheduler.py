@@ -0,0 +1,150 @@
+import asyncio
+import time
+import httpx
+import pytest
+import scheduler as scheduler_module
+from scheduler import TokenBucket, Scheduler, Priority, lane, INTERACTIVE, BACKGROUND
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_backoff", lambda attempt: 0)
+
+def test_bucket_allows_burst_then_limits_rate():
+    async def main():
+        bucket = TokenBucket(rate=20, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        assert time.monotonic() - started < 0.02
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.04
+
+    asyncio.run(main())
+
+def test_interactive_lane_goes_before_background():
+    async def main():
+        bucket = TokenBucket(rate=20, burst=1)
+        await bucket.acquire()
+        order = []
+
+        async def acquire(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        background = asyncio.create_task(acquire("background", BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = [asyncio.create_task(acquire(f"interactive-{i}", INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(background, *interactive)
+        assert order[-1] == "background"
+
+    asyncio.run(main())
+
+def test_promoted_waiter_is_no_longer_blocked_by_interactive_lane():
+    async def main():
+        bucket = TokenBucket(rate=20, burst=1)
+        await bucket.acquire()
+        order = []
+
+        async def acquire(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        priority = Priority(BACKGROUND)
+        prefetch = asyncio.create_task(acquire("prefetch", priority))
+        await asyncio.sleep(0)
+        interactive = [asyncio.create_task(acquire(f"interactive-{i}", INTERACTIVE)) for i in range(2)]
+        await asyncio.sleep(0)
+        assert (bucket.waiting(INTERACTIVE), bucket.waiting(BACKGROUND)) == (2, 1)
+        # 交互请求加入了这个后台请求: 提升后它在下一次检查时换到交互通道, 与其它交互请求平等竞争令牌
+        priority.promote(INTERACTIVE)
+        await asyncio.sleep(0.07)
+        assert bucket.waiting(BACKGROUND) == 0
+        await asyncio.gather(prefetch, *interactive)
+        assert sorted(order) == ["interactive-0", "interactive-1", "prefetch"]
+        assert (bucket.waiting(INTERACTIVE), bucket.waiting(BACKGROUND)) == (0, 0)
+        # 提升只会提高优先级
+        priority.promote(BACKGROUND)
+        assert priority.value == INTERACTIVE
+
+    asyncio.run(main())
+
+def test_pause_blocks_all_lanes():
+    async def main():
+        bucket = TokenBucket(rate=100, burst=10)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(main())
+
+def responses(*statuses, headers=None):
+    """
+    依次返回给定状态码的 send 函数, 同时记录调用次数。
+    """
+    calls = []
+
+    async def send():
+        status = statuses[len(calls)]
+        calls.append(status)
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, headers=headers or {})
+
+    return send, calls
+
+def test_scheduler_retries_server_errors():
+    send, calls = responses(503, 502, 200)
+    response = asyncio.run(Scheduler(100, 10, 3).send(send))
+    assert response.status_code == 200
+    assert calls == [503, 502, 200]
+
+def test_scheduler_returns_last_response_when_retries_run_out():
+    send, calls = responses(500, 500)
+    response = asyncio.run(Scheduler(100, 10, 1).send(send))
+    assert response.status_code == 500
+    assert len(calls) == 2
+
+def test_scheduler_raises_last_transport_error():
+    send, calls = responses(httpx.ConnectError("down"), httpx.ConnectError("still down"))
+    with pytest.raises(httpx.ConnectError, match="still down"):
+        asyncio.run(Scheduler(100, 10, 1).send(send))
+
+def test_scheduler_does_not_retry_client_errors():
+    send, calls = responses(404)
+    assert asyncio.run(Scheduler(100, 10, 3).send(send)).status_code == 404
+    assert calls == [404]
+
+def test_retry_after_pauses_the_bucket_for_the_full_delay(monkeypatch):
+    # 当前请求自身的等待被限制在 BACKOFF_CAP 以内, 但令牌桶按完整的 Retry-After 暂停
+    monkeypatch.setattr(scheduler_module, "BACKOFF_CAP", 0.01)
+    send, calls = responses(429, 200, headers={"retry-after": "0.2"})
+
+    async def main():
+        limiter = Scheduler(100, 10, 3)
+        started = time.monotonic()
+        response = await limiter.send(send)
+        assert response.status_code == 200
+        assert time.monotonic() - started >= 0.19
+
+    asyncio.run(main())
+    assert calls == [429, 200]
+
+def test_scheduler_uses_lane_from_context():
+    seen = []
+
+    class RecordingBucket(TokenBucket):
+        async def acquire(self, priority=INTERACTIVE):
+            seen.append(priority.value)
+            await super().acquire(priority)
+
+    async def main():
+        limiter = Scheduler(100, 10, 0)
+        limiter.bucket = RecordingBucket(100, 10)
+        send, _ = responses(200, 200)
+        await limiter.send(send)
+        with lane(BACKGROUND):
+            await limiter.send(send)
+
+    asyncio.run(main())
+    assert seen == [INTERACTIVE, BACKGROUND]
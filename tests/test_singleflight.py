@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(10)))
+        assert results == [1] * 10
+        assert "k" not in flight
+        # 完成后同一个键会重新执行
+        assert await flight.do("k", fetch) == 2
+
+    asyncio.run(main())
+
+def test_exception_is_shared_and_key_released():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flight.do("k", fetch))
+        second = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import pytest
+import cache as cache_module
+import snapshot as snapshot_module
+from cache import LRUCache, TieredCache
+from records import MediaItem
+from snapshot import load_snapshot, close_snapshot, save_snapshot, Snapshot
+
+@pytest.fixture
+def caches(monkeypatch):
+    """
+    只保存和恢复测试创建的缓存, 不影响模块级的全局缓存。
+    """
+    registry = {}
+    monkeypatch.setattr(cache_module, "CACHES", registry)
+    monkeypatch.setattr(snapshot_module, "CACHES", registry)
+
+    def create(name):
+        return TieredCache(LRUCache(100), name=name)
+
+    return create
+
+def test_round_trip_restores_entries_lazily(tmp_path, caches):
+    path = str(tmp_path / "cache.snap")
+    tmdb_cache, rendered = caches("tmdb"), caches("rendered")
+
+    async def main():
+        await tmdb_cache.set("items", [MediaItem(1, "movie", "Fight Club", "1999-10-15")], 60)
+        await tmdb_cache.set("expired", "old", -1)
+        await tmdb_cache.set("unpicklable", lambda: None, 60)
+        await rendered.set("meta", (b'{"meta":{}}', '"etag"'), 60)
+        assert await save_snapshot(path) == 2
+
+        # 模拟重启: 新进程中的缓存是空的
+        restored_tmdb, restored_rendered = caches("tmdb"), caches("rendered")
+        snapshot = load_snapshot(path)
+        assert len(snapshot) == 2
+        assert restored_tmdb.snapshot is snapshot and restored_rendered.snapshot is snapshot
+        assert len(restored_tmdb.memory) == 0
+
+        items = await restored_tmdb.get("items")
+        assert [(item.id, item.media_type, item.name, item.release_date) for item in items] == [(1, "movie", "Fight Club", "1999-10-15")]
+        # 加载后的条目移入 LRU, 保留剩余的 TTL, 并从快照索引中移除
+        assert restored_tmdb.memory.get("items") is items
+        assert 55 < restored_tmdb.memory.entries()[0][1] - time.time() <= 60
+        assert len(snapshot) == 1
+        assert await restored_tmdb.get("expired") is None
+        assert await restored_tmdb.get("unpicklable") is None
+        assert await restored_rendered.get("meta") == (b'{"meta":{}}', '"etag"')
+        close_snapshot(snapshot)
+        assert restored_tmdb.snapshot is None
+
+    asyncio.run(main())
+
+def test_entries_expiring_after_save_are_not_restored(tmp_path, caches):
+    path = str(tmp_path / "cache.snap")
+    tiered = caches("tmdb")
+
+    async def main():
+        await tiered.set("short", "value", 0.05)
+        assert await save_snapshot(path) == 1
+        await asyncio.sleep(0.06)
+        restored = caches("tmdb")
+        snapshot = load_snapshot(path)
+        assert await restored.get("short") is None
+        # 清理后没有剩余条目
+        assert snapshot.purge_expired() == 0
+        close_snapshot(snapshot)
+
+    asyncio.run(main())
+
+def test_unloaded_entries_are_carried_into_the_next_snapshot(tmp_path, caches):
+    path = str(tmp_path / "cache.snap")
+    tiered = caches("tmdb")
+
+    async def main():
+        await tiered.set("kept", "from-first-run", 60)
+        await tiered.set("replaced", "old", 60)
+        await save_snapshot(path)
+
+        restored = caches("tmdb")
+        snapshot = load_snapshot(path)
+        # 新写入的值覆盖快照中的旧值; 没有访问过的条目原样复制到新快照
+        await restored.set("replaced", "new", 60)
+        assert await save_snapshot(path) == 2
+        close_snapshot(snapshot)
+
+        again = caches("tmdb")
+        snapshot = load_snapshot(path)
+        assert await again.get("kept") == "from-first-run"
+        assert await again.get("replaced") == "new"
+        close_snapshot(snapshot)
+
+    asyncio.run(main())
+
+def test_revalidate_releases_an_exhausted_snapshot(tmp_path, caches, monkeypatch):
+    path = str(tmp_path / "cache.snap")
+    tiered = caches("tmdb")
+    monkeypatch.setattr(snapshot_module, "REVALIDATE_INTERVAL", 0.01)
+
+    async def main():
+        await tiered.set("only", "value", 60)
+        await save_snapshot(path)
+        restored = caches("tmdb")
+        snapshot = load_snapshot(path)
+        assert await restored.get("only") == "value"
+        await asyncio.wait_for(snapshot_module.revalidate_snapshot(snapshot), 1)
+        assert restored.snapshot is None
+
+    asyncio.run(main())
+
+def test_invalid_or_missing_snapshots_are_ignored(tmp_path, caches):
+    caches("tmdb")
+    assert load_snapshot("") is None
+    assert load_snapshot(str(tmp_path / "missing.snap")) is None
+    bogus = tmp_path / "bogus.snap"
+    bogus.write_bytes(b"NOTASNAP" + b"\x00" * 16)
+    assert load_snapshot(str(bogus)) is None
+    truncated = tmp_path / "truncated.snap"
+    truncated.write_bytes(b"STRMSNP1")
+    assert load_snapshot(str(truncated)) is None
+
+def test_snapshot_header_points_at_index(tmp_path, caches):
+    path = str(tmp_path / "cache.snap")
+    tiered = caches("tmdb")
+
+    async def main():
+        await tiered.set("k", {"a": 1}, 60)
+        await save_snapshot(path)
+
+    asyncio.run(main())
+    snapshot = Snapshot(path)
+    [(key, expires_at, data)] = snapshot.entries("tmdb")
+    assert key == "k" and expires_at > time.time()
+    assert snapshot.pop("tmdb", "k")[1] == {"a": 1}
+    assert snapshot.pop("tmdb", "k") is None
+    snapshot.close()
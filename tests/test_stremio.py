@@ -0,0 +1,138 @@
+import asyncio
+import httpx
+import pytest
+import stremio
+from cache import LRUCache
+from circuit_breaker import track_degraded
+from main import app
+from records import MediaItem
+from scheduler import current_lane, INTERACTIVE, BACKGROUND
+
+@pytest.fixture
+def genres(monkeypatch):
+    """
+    模拟 TMDB 的类型列表和 discover 接口, 使用独立的类型映射。
+    返回状态字典: available 控制类型列表是否获取成功, calls 记录类型列表的请求次数, discovered 记录 discover 的类型参数。
+    """
+    state = {"available": False, "calls": 0, "discovered": []}
+
+    async def get_genres(media_type, language):
+        state["calls"] += 1
+        return [{"id": 28, "name": "动作"}] if state["available"] else []
+
+    async def discover_media(media_type, genre_id, sort_by, year, page, language, region, adult):
+        state["discovered"].append(genre_id)
+        return [MediaItem(page, media_type, f"item-{page}")]
+
+    monkeypatch.setattr(stremio, "get_genres", get_genres)
+    monkeypatch.setattr(stremio, "discover_media", discover_media)
+    monkeypatch.setattr(stremio, "GENRE_IDS", LRUCache(4))
+    return state
+
+def test_failed_genre_lookup_is_degraded_and_retried(genres, monkeypatch):
+    monkeypatch.setattr(stremio, "GENRE_IDS_RETRY_TTL", 0.01)
+
+    async def main():
+        reasons = track_degraded()
+        # 类型列表获取失败时不能退回未筛选的列表, 响应标记为降级, 不会被当作正常结果缓存
+        assert await stremio.get_catalog(None, "movie", "tmdb-discover-all", {"类型": "动作"}) == {"metas": []}
+        assert reasons == {"error:genres"}
+        assert genres["discovered"] == []
+
+        genres["available"] = True
+        await asyncio.sleep(0.02)
+        result = await stremio.get_catalog(None, "movie", "tmdb-discover-all", {"类型": "动作"})
+        assert [meta["id"] for meta in result["metas"]] == ["tmdb:1"]
+        assert genres["discovered"][0] == 28
+        assert genres["calls"] == 4
+
+    asyncio.run(main())
+
+def test_unknown_genre_returns_no_results(genres):
+    genres["available"] = True
+
+    async def main():
+        reasons = track_degraded()
+        assert await stremio.get_catalog(None, "movie", "tmdb-discover-all", {"类型": "不存在"}) == {"metas": []}
+        assert reasons == set()
+        assert genres["discovered"] == []
+
+    asyncio.run(main())
+
+def test_meta_id_pattern_matches_whole_id():
+    for tmdb_id in ("tmdb:550", "550", "tt0137523"):
+        assert stremio.META_ID_PATTERN.fullmatch(tmdb_id)
+    for tmdb_id in ("123\n", "tmdb:550\n", "tt1 ", "tmdb:", "550abc", "١٢٣", "../550"):
+        assert not stremio.META_ID_PATTERN.fullmatch(tmdb_id)
+
+def test_malformed_meta_ids_do_not_reach_tmdb(upstream):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://addon.test") as client:
+            response = await client.get("/meta/movie/123%0A.json")
+            assert response.status_code == 200 and response.json() == {"meta": {}}
+            response = await client.post("/meta/movie/batch.json", json={"ids": ["550", "123\n456"]})
+            assert response.status_code == 400
+
+    asyncio.run(main())
+    assert upstream["calls"] == 0
+
+def paged(total):
+    """
+    模拟共有 total 条结果的 TMDB 列表接口, 每页 PAGE_SIZE 条; 返回 (fetch_page, 请求过的页码)。
+    """
+    requested = []
+
+    async def fetch_page(page):
+        requested.append(page)
+        start = (page - 1) * stremio.PAGE_SIZE
+        return list(range(start, min(start + stremio.PAGE_SIZE, total)))
+
+    return fetch_page, requested
+
+def test_fetch_window_on_page_boundary_reads_one_page():
+    fetch_page, requested = paged(100)
+
+    async def main():
+        assert await stremio._fetch_window(fetch_page, 40) == list(range(40, 60))
+        await asyncio.gather(*stremio._background_tasks)
+
+    asyncio.run(main())
+    # 第 3 页是整页, 在后台预取第 4 页
+    assert requested == [3, 4]
+
+def test_fetch_window_stitches_adjacent_pages():
+    fetch_page, requested = paged(100)
+
+    async def main():
+        assert await stremio._fetch_window(fetch_page, 30) == list(range(30, 50))
+        await asyncio.gather(*stremio._background_tasks)
+
+    asyncio.run(main())
+    assert requested == [2, 3, 4]
+
+def test_fetch_window_does_not_prefetch_after_a_partial_page():
+    fetch_page, requested = paged(45)
+
+    async def main():
+        # 最后一页不满一页, 没有下一页可以预取
+        assert await stremio._fetch_window(fetch_page, 30) == list(range(30, 45))
+        assert await stremio._fetch_window(fetch_page, 60) == []
+        assert not stremio._background_tasks
+
+    asyncio.run(main())
+    assert requested == [2, 3, 4]
+
+def test_prefetch_runs_in_background_lane():
+    lanes = []
+
+    async def fetch_page(page):
+        lanes.append(current_lane())
+        return list(range(stremio.PAGE_SIZE))
+
+    async def main():
+        await stremio._fetch_window(fetch_page, 0)
+        await asyncio.gather(*stremio._background_tasks)
+
+    asyncio.run(main())
+    assert lanes == [INTERACTIVE, BACKGROUND]
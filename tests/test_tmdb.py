@@ -0,0 +1,55 @@
+import asyncio
+import httpx
+import fake_tmdb
+import tmdb
+from circuit_breaker import track_degraded
+
+def test_details_take_one_request_per_title_and_language(upstream):
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.path, dict(request.url.params)))
+        return httpx.Response(200, json=fake_tmdb._generate(request.url.path.removeprefix("/3"), dict(request.url.params)))
+
+    upstream["handler"] = handler
+
+    async def main():
+        # 缓存未命中时一次请求同时填充与语言无关的详情和该语言的字段
+        movie = await tmdb.get_meta("movie", 77, "zh-CN")
+        assert requests == [("/3/movie/77", {"language": "zh-CN", "append_to_response": "external_ids,credits"})]
+        assert movie["title"] == "电影 77" and movie["external_ids"] == {"imdb_id": "tt0000077"}
+        assert len(movie["credits"]["cast"]) == 10
+
+        # 其它语言只请求随语言变化的字段
+        requests.clear()
+        assert (await tmdb.get_meta("movie", 77, "en-US"))["credits"] == movie["credits"]
+        assert requests == [("/3/movie/77", {"language": "en-US"})]
+        requests.clear()
+        await tmdb.get_meta("movie", 77, "en-US")
+        assert requests == []
+
+        # 剧集的其它语言从分季的批量请求中获取这些字段, 不再单独请求
+        series = await tmdb.get_meta("tv", 8, "zh-CN")
+        await tmdb.get_series_episodes(series, "zh-CN")
+        requests.clear()
+        series = await tmdb.get_meta("tv", 8, "en-US")
+        episodes = await tmdb.get_series_episodes(series, "en-US")
+        assert requests == [("/3/tv/8", {"language": "en-US", "append_to_response": "season/1,season/2,season/3"})]
+        assert series["name"] == "剧集 8" and sorted(episodes) == [1, 2, 3]
+
+    asyncio.run(main())
+
+def test_details_fall_back_to_stale_entries(upstream, monkeypatch):
+    monkeypatch.setattr(tmdb, "TTL_META", 0.01)
+    upstream["handler"] = lambda request: httpx.Response(200, json=fake_tmdb._generate("/movie/5", dict(request.url.params)))
+
+    async def main():
+        movie = await tmdb.get_meta("movie", 5, "zh-CN")
+        await asyncio.sleep(0.02)
+        upstream["handler"] = lambda request: httpx.Response(503)
+        reasons = track_degraded()
+        assert await tmdb.get_meta("movie", 5, "zh-CN") == movie
+        assert "stale:/movie/{id}" in reasons
+        assert await tmdb.get_meta("movie", 6, "zh-CN") is None
+
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import gzip
+import json
+import pytest
+from tmdb_index import build_index, load_index, normalize_text, TMDBIndex
+
+MOVIES = [
+    {"id": 550, "original_title": "Fight Club", "popularity": 60.5, "adult": False},
+    {"id": 603, "original_title": "The Matrix", "popularity": 80.0, "adult": False, "imdb_id": "tt0133093"},
+    {"id": 604, "original_title": "The Matrix Reloaded", "popularity": 40.0, "adult": False},
+    {"id": 13, "original_title": "阿甘正传", "popularity": 55.0, "adult": False},
+    {"id": 99, "original_title": "Hidden", "popularity": 99.0, "adult": True},
+]
+SERIES = [
+    {"id": 1396, "original_name": "Breaking Bad", "popularity": 90.0},
+    {"id": 1399, "original_name": "Game of Thrones", "popularity": 85.0},
+    {"id": 60625, "original_name": "Ｒｉｃｋ and Morty", "popularity": 70.0},
+]
+
+def write_export(path, items):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        f.write("\n")
+
+@pytest.fixture
+def index(tmp_path):
+    movies = tmp_path / "movie_ids.json.gz"
+    series = tmp_path / "tv_series_ids.json.gz"
+    imdb_map = tmp_path / "imdb_map.tsv"
+    write_export(movies, MOVIES)
+    write_export(series, SERIES)
+    imdb_map.write_text("tt0137523\tmovie\t550\ntt0903747\ttv\t1396\nbroken line\ntt1\tperson\t1\n", encoding="utf-8")
+    output = tmp_path / "index.bin"
+    # 成人内容不写入索引
+    assert build_index(str(output), [str(movies)], [str(series)], [str(imdb_map)]) == 7
+    assert not (tmp_path / "index.bin.tmp").exists()
+    return TMDBIndex(str(output))
+
+def test_find_by_imdb(index):
+    assert index.find_by_imdb("tt0137523", "movie") == 550
+    assert index.find_by_imdb("tt0133093", "movie") == 603
+    assert index.find_by_imdb("tt0903747", "tv") == 1396
+    # 同一个 IMDb ID 按媒体类型区分
+    assert index.find_by_imdb("tt0903747", "movie") is None
+    assert index.find_by_imdb("tt9999999", "movie") is None
+    assert index.find_by_imdb("nm0000001", "movie") is None
+
+def test_search_orders_by_popularity_and_filters_media_type(index):
+    results = index.search("matrix")
+    assert [(result["id"], result["media_type"]) for result in results] == [(603, "movie"), (604, "movie")]
+    assert results[0]["title"] == "The Matrix"
+    assert index.search("matrix", "tv") == []
+    assert [result["id"] for result in index.search("the", limit=1)] == [603]
+
+def test_search_substrings_and_normalization(index):
+    assert [result["id"] for result in index.search("reload")] == [604]
+    assert [result["id"] for result in index.search("甘正")] == [13]
+    # 全角字符和大小写在建索引和查询时都被规范化
+    assert [result["id"] for result in index.search("RICK  AND")] == [60625]
+    assert index.search("rick and", "movie") == []
+    assert index.search("hidden") == []
+    assert index.search("   ") == []
+
+def test_single_character_query_uses_prefix(index):
+    assert {result["id"] for result in index.search("g")} == {1399}
+    assert [result["id"] for result in index.search("阿")] == [13]
+
+def test_normalize_text():
+    assert normalize_text("  Ｔｈｅ   MATRIX ") == "the matrix"
+
+def test_load_index_rejects_invalid_files(tmp_path):
+    assert load_index("") is None
+    assert load_index(str(tmp_path / "missing.bin")) is None
+    bogus = tmp_path / "bogus.bin"
+    bogus.write_bytes(b"NOTANIDX" + b"\x00" * 32)
+    assert load_index(str(bogus)) is None
@@ -0,0 +1,42 @@
+import pytest
+from user_config import DEFAULT_CONFIG, UserConfig, parse_config
+
+def test_parses_all_options():
+    config = parse_config("language=en-US&region=US&adult=true&catalogs=series.tmdb-popular,movie.tmdb-search")
+    assert config == UserConfig("en-US", "US", True, ("movie.tmdb-search", "series.tmdb-popular"))
+    assert config.shows("movie", "tmdb-search") and not config.shows("movie", "tmdb-popular")
+
+def test_empty_and_default_values_give_the_default_config():
+    assert parse_config("") == DEFAULT_CONFIG
+    config = parse_config("language=zh-CN&region=&adult=false&catalogs=")
+    assert config == DEFAULT_CONFIG
+    assert config.key == ""
+    assert config.shows("series", "tmdb-top-rated")
+    assert config.manifest_url("https://addon.test") == "https://addon.test/manifest.json"
+
+def test_key_is_canonical():
+    # 参数顺序、目录顺序和重复项不影响规范化的配置段, 等价的配置共用缓存
+    first = parse_config("catalogs=series.tmdb-popular,movie.tmdb-popular,movie.tmdb-popular&adult=1&language=en")
+    second = parse_config("language=en&adult=yes&catalogs=movie.tmdb-popular,series.tmdb-popular")
+    assert first == second
+    assert first.key == second.key == "language=en&adult=true&catalogs=movie.tmdb-popular,series.tmdb-popular"
+    assert parse_config(first.key) == first
+    assert first.manifest_url("https://addon.test") == f"https://addon.test/{first.key}/manifest.json"
+
+@pytest.mark.parametrize("text", [
+    "theme=dark",
+    "language=xx-XX",
+    "language=en-us",
+    "language=en-US%0A",
+    "language=" + "a" * 200,
+    "region=usa",
+    "region=us",
+    "region=US%0A",
+    "catalogs=movie.tmdb-popular,tv.tmdb-popular",
+    "catalogs=movie.tmdb-popular%0A",
+    "language",
+    "language=en-US&&adult=true",
+])
+def test_rejects_unknown_or_malformed_values(text):
+    with pytest.raises(ValueError):
+        parse_config(text)
@@ -1,79 +1,411 @@
-import requests
-from config import TMDB_ACCESS_TOKEN, PROXIES
+import asyncio
+import logging
+import time
+import httpx
+import metrics
+from cache import cache
+from scheduler import scheduler, current_lane, Priority
+from circuit_breaker import get_breaker, mark_degraded, STALE_SERVED
+from singleflight import SingleFlight
+from records import MediaItem, Episode, episode_texts
+from user_config import DEFAULT_LANGUAGE
+from tmdb_index import index as local_index
+from config import (
+    TMDB_ACCESS_TOKEN, TMDB_BASE_URL, PROXIES, TMDB_HTTP2, TMDB_MAX_CONNECTIONS,
+    TMDB_MAX_KEEPALIVE_CONNECTIONS, TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT, TMDB_REQUEST_DEADLINE
+)
+
+logger = logging.getLogger(__name__)
 
 # TMDB API 的基础 URL 和通用请求头
-BASE_URL = "https://api.themoviedb.org/3"
+BASE_URL = TMDB_BASE_URL
 HEADERS = {
     "accept": "application/json",
     "Authorization": f"Bearer {TMDB_ACCESS_TOKEN}"
 }
 
-def get_meta(media_type, tmdb_id):
+# 各类接口的缓存时间 (秒): 榜单和搜索变化快, 详情 (含演职员) 适中, 类型和已完结剧集的分季几乎不变
+TTL_SHORT = 15 * 60
+TTL_META = 6 * 3600
+TTL_SEASON = 6 * 3600
+TTL_LONG = 7 * 24 * 3600
+
+# 缓存条目的格式版本, 缓存内容的结构变化时递增, 使二级缓存中旧格式的条目不再被读取
+CACHE_VERSION = 5
+
+# append_to_response 每次最多附加 20 个子请求
+SEASONS_PER_REQUEST = 20
+# 详情中附加的子请求, 与语言无关的详情按这组参数缓存 (参见 _slim_details)
+DETAILS_PARAMS = {'append_to_response': 'external_ids,credits'}
+
+# HTTP/2 需要安装 h2 (httpx[http2]), 未安装时自动退回 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 进程内共享的异步客户端, 复用连接池以避免每次请求都重新建立 TCP+TLS 连接
+_client = None
+# 合并并发的相同上游请求, 避免缓存未命中时大量请求同时打到 TMDB
+_inflight = SingleFlight()
+# 进行中的上游请求的优先级: 缓存键 -> Priority。
+# 交互请求加入一个仍在排队的后台预取时提升它, 避免在后台通道中等待其它交互请求
+_priorities = {}
+
+def _build_transport(proxy=None):
+    limits = httpx.Limits(
+        max_connections=TMDB_MAX_CONNECTIONS,
+        max_keepalive_connections=TMDB_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    return httpx.AsyncHTTPTransport(http2=TMDB_HTTP2 and HTTP2_AVAILABLE, limits=limits, proxy=proxy)
+
+def get_client():
+    """
+    返回共享的 httpx.AsyncClient, 首次调用时创建。
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        mounts = {f"{scheme}://": _build_transport(proxy) for scheme, proxy in PROXIES.items()}
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            headers=HEADERS,
+            transport=_build_transport(),
+            mounts=mounts,
+            timeout=httpx.Timeout(TMDB_READ_TIMEOUT, connect=TMDB_CONNECT_TIMEOUT, pool=TMDB_CONNECT_TIMEOUT),
+        )
+    return _client
+
+async def close_client():
+    """
+    关闭共享客户端并释放连接池, 在应用关闭时调用。
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _cache_key(path, params):
+    query = "&".join(f"{key}={value}" for key, value in sorted((params or {}).items()))
+    return f"tmdb:v{CACHE_VERSION}:{path}?{query}"
+
+async def _get(path, params=None, ttl=None, shape=None):
+    """
+    通过共享客户端请求 TMDB API 并返回解析后的 JSON。
+    指定 ttl 时, 结果按接口路径和参数缓存 ttl 秒; 指定 shape 时, 缓存和返回的是 shape(JSON) 的结果。
+    并发的相同请求只会向 TMDB 发出一次。
+    上游故障 (网络错误、超时、5xx、熔断) 时, 如果进程内还保留着已过期的数据, 则返回过期数据并把当前响应标记为降级。
+    """
+    key = _cache_key(path, params)
+    if ttl:
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+    if key not in _inflight:
+        _priorities[key] = Priority(current_lane())
+    priority = _priorities.get(key)
+    if priority is not None:
+        priority.promote(current_lane())
+    try:
+        return await _inflight.do(key, lambda: _fetch(path, params, key, ttl, shape, priority))
+    except httpx.HTTPError as e:
+        # 4xx (除 429 外) 是请求本身的问题, 不属于上游故障
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 and e.response.status_code != 429:
+            raise
+        endpoint = _endpoint(path)
+        stale = cache.get_stale(key) if ttl else None
+        if stale is None:
+            mark_degraded(f"error:{endpoint}")
+            raise
+        STALE_SERVED.inc(endpoint)
+        mark_degraded(f"stale:{endpoint}")
+        logger.warning(f"请求 TMDB {endpoint} 时发生错误, 使用过期缓存: {e}")
+        return stale
+
+# 以这些资源开头的路径中, 资源名和子资源名之后的每一段都是 ID, 例如 /tv/{id}/season/{id}
+_ID_RESOURCES = ("movie", "tv", "person", "find", "collection")
+
+def _endpoint(path):
+    # 用于指标、追踪和熔断器的接口名, 路径中所有可变的段都替换为 {id}, 使标签数量与客户端传入的 ID 无关
+    segments = path.strip("/").split("/")
+    if segments[0] in _ID_RESOURCES:
+        segments = ["{id}" if i % 2 else segment for i, segment in enumerate(segments)]
+    return "/" + "/".join(segments)
+
+async def _fetch(path, params, key, ttl, shape, priority):
+    try:
+        return await _fetch_once(path, params, key, ttl, shape, priority)
+    finally:
+        if _priorities.get(key) is priority:
+            del _priorities[key]
+
+async def _fetch_once(path, params, key, ttl, shape, priority):
+    endpoint = _endpoint(path)
+    data = None
+
+    async def send():
+        nonlocal data
+        started = time.perf_counter()
+        metrics.TMDB_INFLIGHT.inc()
+        try:
+            response = await asyncio.wait_for(get_client().get(path, params=params), TMDB_REQUEST_DEADLINE)
+        except asyncio.TimeoutError:
+            metrics.record_upstream(endpoint, "error", started)
+            raise httpx.TimeoutException(f"TMDB 接口 {endpoint} 在 {TMDB_REQUEST_DEADLINE} 秒内未完成")
+        except httpx.HTTPError:
+            metrics.record_upstream(endpoint, "error", started)
+            raise
+        finally:
+            metrics.TMDB_INFLIGHT.dec()
+        metrics.record_upstream(endpoint, response.status_code, started)
+        if response.is_success:
+            # 代理或认证门户可能返回 200 的 HTML 页面, 作为上游故障处理, 交给熔断器和过期缓存降级
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise httpx.DecodingError(f"TMDB 接口 {endpoint} 返回的不是有效的 JSON: {e}", request=response.request)
+        return response
+
+    # 经由调度器发出请求, 以遵守 TMDB 限流并在 429/5xx 时自动重试。
+    # 熔断器和时限只作用于每一次实际发出的请求, 在限流器中排队不会被当作上游故障;
+    # 同一接口持续失败时由熔断器直接拒绝, 不再排队、占用连接和等待超时
+    breaker = get_breaker(endpoint)
+    breaker.check()
+    response = await scheduler.send(lambda: breaker.call(send), priority)
+    response.raise_for_status()
+    if shape is not None:
+        data = shape(data)
+    if ttl:
+        await cache.set(key, data, ttl)
+    return data
+
+def _slim_details(data):
+    """
+    只保留生成 Stremio meta 和获取分季所需的、与语言无关的字段, 演职员只保留前 10 位演员和导演。
+    这部分详情所有语言共用一份缓存; 标题、简介、海报和类型名称由 _slim_localized 按语言缓存。
+    """
+    credits = data.get('credits') or {}
+    episode_fields = ('season_number', 'episode_number')
+    return {
+        'id': data.get('id'),
+        'vote_average': data.get('vote_average'),
+        'release_date': data.get('release_date'),
+        'first_air_date': data.get('first_air_date'),
+        'last_air_date': data.get('last_air_date'),
+        'status': data.get('status'),
+        'external_ids': {'imdb_id': (data.get('external_ids') or {}).get('imdb_id')},
+        'created_by': [{'name': creator.get('name')} for creator in data.get('created_by', [])],
+        'seasons': [{'season_number': season.get('season_number'), 'air_date': season.get('air_date')} for season in data.get('seasons', [])],
+        'next_episode_to_air': {key: data['next_episode_to_air'].get(key) for key in episode_fields} if data.get('next_episode_to_air') else None,
+        'last_episode_to_air': {key: data['last_episode_to_air'].get(key) for key in episode_fields} if data.get('last_episode_to_air') else None,
+        'credits': {
+            'cast': [{'name': member.get('name')} for member in credits.get('cast', [])[:10]],
+            'crew': [{'name': member.get('name'), 'job': 'Director'} for member in credits.get('crew', []) if member.get('job') == 'Director'],
+        },
+    }
+
+def _slim_localized(data):
+    """
+    详情中随语言变化的字段。按语言请求, 由 TMDB 选择该语言的标题、简介和海报, 缺少翻译时的回退规则也与 TMDB 一致。
+    """
+    return {
+        'title': data.get('title'),
+        'name': data.get('name'),
+        'overview': data.get('overview'),
+        'poster_path': data.get('poster_path'),
+        'backdrop_path': data.get('backdrop_path'),
+        'genres': [{'id': genre.get('id'), 'name': genre.get('name')} for genre in data.get('genres', [])],
+    }
+
+def _top_person(data):
+    # 只缓存人气最高的人物的 ID
+    results = sorted(data.get("results", []), key=lambda x: x.get('popularity', 0), reverse=True)
+    return [results[0]["id"]] if results else []
+
+def _combined_works(data):
+    # 使用字典按ID合并 crew 和 cast 列表以自动去重, cast 中重复的作品会覆盖 crew 中的, 但内容基本相同
+    all_works = {}
+    for work in data.get("crew", []) + data.get("cast", []):
+        if work.get('id'):
+            all_works[work['id']] = work
+    return _media_items(all_works.values())
+
+def _media_items(results, media_type=None):
+    """
+    把 TMDB 列表结果转换为 MediaItem, 只保留电影和剧集 (例如过滤掉 /search/multi 中的人物)。
     """
-    从 TMDB API 获取单个电影或剧集的详细元数据, 并附加外部ID(如IMDb ID)。
-    如果提供的是 IMDb ID, 会先查找对应的 TMDB ID。
+    items = []
+    for result in results:
+        item = MediaItem.from_tmdb(result, media_type)
+        if item.media_type in ('movie', 'tv'):
+            items.append(item)
+    return items
+
+def _season_episodes(season):
+    return [Episode.from_tmdb(episode) for episode in season.get("episodes", [])]
+
+async def get_meta(media_type, tmdb_id, language=DEFAULT_LANGUAGE):
+    """
+    从 TMDB API 获取单个电影或剧集的详细元数据, 并在同一次请求中附加外部ID(如IMDb ID)和演职员信息。
+    如果提供的是 IMDb ID, 会先查找对应的 TMDB ID。与语言无关的精简数据 (参见 _slim_details) 所有语言共用一份缓存,
+    标题、简介、海报和类型名称按 language 缓存 (参见 _slim_localized)。缓存未命中时只发出一次请求同时填充两者;
+    只有与语言无关的部分已缓存时, 才单独请求该语言的字段 (剧集优先从分季的批量请求中获取)。
     """
     if media_type not in ["movie", "tv"]:
         return None
 
-    # 如果是 IMDb ID, 先查找 TMDB ID
+    # 如果是 IMDb ID, 先在本地索引中查找 TMDB ID, 找不到时再调用 /find 接口
+    if str(tmdb_id).startswith("tt") and local_index is not None:
+        tmdb_id = local_index.find_by_imdb(tmdb_id, media_type) or tmdb_id
     if str(tmdb_id).startswith("tt"):
-        find_url = f"{BASE_URL}/find/{tmdb_id}?external_source=imdb_id"
         try:
-            response = requests.get(find_url, headers=HEADERS, proxies=PROXIES)
-            response.raise_for_status()
-            find_results = response.json()
+            find_results = await _get(f"/find/{tmdb_id}", {'external_source': 'imdb_id'}, TTL_LONG)
             # 根据 media_type 确定要查找的键
             result_key = 'tv_results' if media_type == 'tv' else 'movie_results'
             results = find_results.get(result_key, [])
             if not results:
                 return None
             tmdb_id = results[0]['id']  # 使用找到的第一个结果的ID
-        except requests.exceptions.RequestException as e:
-            print(f"通过 IMDb ID 查找时发生错误: {e}")
+        except httpx.HTTPError as e:
+            logger.warning(f"通过 IMDb ID 查找时发生错误: {e}")
             return None
 
     # 使用 TMDB ID 获取详细信息
-    url = f"{BASE_URL}/{media_type}/{tmdb_id}?language=zh-CN&append_to_response=external_ids"
-    try:
-        response = requests.get(url, headers=HEADERS, proxies=PROXIES)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB 元数据时发生错误: {e}")
-        return None
+    path = f"/{media_type}/{tmdb_id}"
+    details_key = _cache_key(path, DETAILS_PARAMS)
+    localized_key = _cache_key(path, {'language': language})
+    details = await cache.get(details_key)
+    if details is None:
+        return await _get_full_details(path, language, details_key, localized_key)
 
-def get_season_episodes(tv_id, season_number):
+    localized = await cache.get(localized_key)
+    if localized is None and media_type == 'tv':
+        # 分季的批量请求也返回这些字段: 还有季度需要获取时由它一并写入缓存, 不再单独请求
+        await get_series_episodes(details, language)
+        localized = await cache.get(localized_key)
+    if localized is None:
+        try:
+            localized = await _get(path, {'language': language}, TTL_META, _slim_localized)
+        except httpx.HTTPError as e:
+            logger.warning(f"请求 TMDB 元数据时发生错误: {e}")
+            return None
+    return {**details, **localized}
+
+async def _get_full_details(path, language, details_key, localized_key):
     """
-    获取单个季度的所有分集信息。
+    用一次请求获取 language 语言的完整详情 (附加外部ID和演职员), 同时写入与语言无关的缓存和该语言的缓存。
+    请求失败时退回进程内仍保留的过期数据。
     """
-    url = f"{BASE_URL}/tv/{tv_id}/season/{season_number}?language=zh-CN"
     try:
-        response = requests.get(url, headers=HEADERS, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("episodes", [])
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB 季度 {season_number} 信息时发生错误: {e}")
-        return []
+        details, localized = await _get(path, {'language': language, **DETAILS_PARAMS}, shape=lambda data: (_slim_details(data), _slim_localized(data)))
+    except httpx.HTTPError as e:
+        details, localized = cache.get_stale(details_key), cache.get_stale(localized_key)
+        if details is None or localized is None:
+            logger.warning(f"请求 TMDB 元数据时发生错误: {e}")
+            return None
+        endpoint = _endpoint(path)
+        STALE_SERVED.inc(endpoint)
+        mark_degraded(f"stale:{endpoint}")
+        return {**details, **localized}
+    await cache.set(details_key, details, TTL_META)
+    await cache.set(localized_key, localized, TTL_META)
+    return {**details, **localized}
+
+def _frozen_seasons(series, season_numbers):
+    """
+    返回已播完、不会再变化的季度编号集合。
+    已完结或被取消的剧集所有季度都视为已播完; 否则以下一集 (或最近播出的一集) 所在季度为当前季度,
+    只有当前季度及之后的季度需要定期刷新。
+    """
+    if series.get('status') in ['Ended', 'Canceled']:
+        return set(season_numbers)
+    current_episode = series.get('next_episode_to_air') or series.get('last_episode_to_air') or {}
+    current = current_episode.get('season_number')
+    if current is None:
+        current = max(season_numbers, default=0)
+    return {number for number in season_numbers if number < current}
+
+async def get_series_episodes(series, language=DEFAULT_LANGUAGE):
+    """
+    获取剧集所有季度 (不含特别篇) 的分集信息, 返回 {季度编号: (Episode 列表, {集数: (标题, 简介)})}。
+    series 是 get_meta 返回的剧集详情。每个季度单独缓存, 已播完的季度长期缓存,
+    缓存未命中的季度通过 append_to_response=season/N 批量获取, 每次请求最多 20 季。
+    分集的编号和播出日期与语言无关, 所有语言共用一份缓存; 只有标题和简介按语言缓存。
+    """
+    tv_id = series.get('id')
+    season_numbers = sorted(s.get('season_number') for s in series.get('seasons', []) if s.get('season_number') != 0)
+    frozen = _frozen_seasons(series, season_numbers)
+
+    def keys(number):
+        path = f"/tv/{tv_id}/season/{number}"
+        return _cache_key(path, None), _cache_key(path, {'language': language})
+
+    episodes = {}
+    skeletons = {}
+    missing = []
+    for number in season_numbers:
+        skeleton_key, texts_key = keys(number)
+        skeleton = await cache.get(skeleton_key)
+        texts = await cache.get(texts_key)
+        if skeleton is not None and texts is not None:
+            episodes[number] = (skeleton, texts)
+        else:
+            if skeleton is not None:
+                skeletons[number] = skeleton
+            missing.append(number)
 
-def get_genres(media_type="movie"):
+    async def fetch_batch(numbers):
+        batch_params = {'language': language, 'append_to_response': ",".join(f"season/{number}" for number in numbers)}
+        try:
+            data = await _get(f"/tv/{tv_id}", batch_params)
+        except httpx.HTTPError as e:
+            logger.warning(f"批量请求 TMDB 季度 {numbers} 信息时发生错误: {e}")
+            # 退回到进程内仍保留的过期分季数据
+            for number in numbers:
+                skeleton_key, texts_key = keys(number)
+                skeleton, texts = cache.get_stale(skeleton_key), cache.get_stale(texts_key)
+                if skeleton is not None and texts is not None:
+                    STALE_SERVED.inc("/tv/{id}/season/{id}")
+                    mark_degraded("stale:/tv/{id}/season/{id}")
+                    episodes[number] = (skeleton, texts)
+            return
+        for number in numbers:
+            season = data.get(f"season/{number}")
+            if season is None:
+                continue
+            ttl = TTL_LONG if number in frozen else TTL_SEASON
+            skeleton_key, texts_key = keys(number)
+            # 其它语言已缓存的分集结构直接复用, 各语言共享同一个列表对象
+            skeleton = skeletons.get(number)
+            if skeleton is None:
+                skeleton = _season_episodes(season)
+                await cache.set(skeleton_key, skeleton, ttl)
+            texts = episode_texts(season.get("episodes", []))
+            await cache.set(texts_key, texts, ttl)
+            episodes[number] = (skeleton, texts)
+        # 批量请求的响应本身就是该语言的剧集详情
+        await cache.set(_cache_key(f"/tv/{tv_id}", {'language': language}), _slim_localized(data), TTL_META)
+
+    batches = [missing[i:i + SEASONS_PER_REQUEST] for i in range(0, len(missing), SEASONS_PER_REQUEST)]
+    await asyncio.gather(*(fetch_batch(numbers) for numbers in batches))
+    return episodes
+
+async def get_genres(media_type="movie", language=DEFAULT_LANGUAGE):
     """
     获取 TMDB 的类型列表, 并排除“成人”类型。
     """
-    url = f"{BASE_URL}/genre/{media_type}/list?language=zh-CN"
     try:
-        response = requests.get(url, headers=HEADERS, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
+        data = await _get(f"/genre/{media_type}/list", {'language': language}, TTL_LONG)
         return [genre for genre in data.get("genres", []) if genre['name'] != "成人"]
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB 类型列表时发生错误: {e}")
+    except httpx.HTTPError as e:
+        logger.warning(f"请求 TMDB 类型列表时发生错误: {e}")
         return []
 
-def discover_media(media_type="movie", genre_id=None, sort_by="popular", year=None, page=1):
+async def discover_media(media_type="movie", genre_id=None, sort_by="popular", year=None, page=1,
+                         language=DEFAULT_LANGUAGE, region="", adult=False):
     """
-    根据多种条件发现影视内容, 支持分页, 排除成人内容。
+    根据多种条件发现影视内容, 支持分页, 默认排除成人内容。返回 MediaItem 列表。
+    region 只对电影生效, 按该地区的上映日期筛选。
     """
     sort_map = {
         "popular": "popularity.desc",
@@ -83,11 +415,13 @@ def discover_media(media_type="movie", genre_id=None, sort_by="popular", year=No
     sort_param = sort_map.get(sort_by, "popularity.desc")
 
     params = {
-        'language': 'zh-CN',
+        'language': language,
         'sort_by': sort_param,
         'page': page,
-        'include_adult': 'false'
+        'include_adult': 'true' if adult else 'false'
     }
+    if region and media_type == 'movie':
+        params['region'] = region
     if genre_id:
         params['with_genres'] = genre_id
     if year:
@@ -98,101 +432,47 @@ def discover_media(media_type="movie", genre_id=None, sort_by="popular", year=No
     if sort_param == "vote_average.desc":
         params['vote_count.gte'] = 300 if media_type == 'movie' else 200
 
-    url = f"{BASE_URL}/discover/{media_type}"
     try:
-        response = requests.get(url, headers=HEADERS, params=params, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("results", [])
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB discover API 时发生错误: {e}")
+        return await _get(f"/discover/{media_type}", params, TTL_SHORT, lambda data: _media_items(data.get("results", []), media_type))
+    except httpx.HTTPError as e:
+        logger.warning(f"请求 TMDB discover API 时发生错误: {e}")
         return []
 
-def search_media(query, page=1):
+async def search_media(query, page=1, language=DEFAULT_LANGUAGE, adult=False):
     """
-    使用 /search/multi 端点搜索电影和电视剧。
+    使用 /search/multi 端点搜索电影和电视剧, 返回 MediaItem 列表。
     """
     params = {
         'query': query,
-        'language': 'zh-CN',
+        'language': language,
         'page': page,
-        'include_adult': 'false'
+        'include_adult': 'true' if adult else 'false'
     }
-    url = f"{BASE_URL}/search/multi"
     try:
-        response = requests.get(url, headers=HEADERS, params=params, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
-        # 过滤掉非电影和电视剧的结果 (例如: 人物)
-        return [item for item in data.get("results", []) if item.get('media_type') in ['movie', 'tv']]
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB search API 时发生错误: {e}")
+        return await _get("/search/multi", params, TTL_SHORT, lambda data: _media_items(data.get("results", [])))
+    except httpx.HTTPError as e:
+        logger.warning(f"请求 TMDB search API 时发生错误: {e}")
         return []
 
-def get_credits(media_type, tmdb_id):
+async def search_person(query, adult=False):
     """
-    获取电影或剧集的演职员信息。
+    搜索人物并返回人气最高的结果的 ID。人物 ID 与语言无关, 不按语言请求, 所有语言共用缓存。
     """
-    if media_type not in ["movie", "tv"]:
-        return None
-    url = f"{BASE_URL}/{media_type}/{tmdb_id}/credits?language=zh-CN"
-    try:
-        response = requests.get(url, headers=HEADERS, proxies=PROXIES)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB credits API 时发生错误: {e}")
-        return None
-
-def search_person(query):
-    """
-    搜索人物并返回人气最高的结果的 ID。
-    """
-    params = {'query': query, 'language': 'zh-CN', 'include_adult': 'false'}
-    url = f"{BASE_URL}/search/person"
+    params = {'query': query, 'include_adult': 'true' if adult else 'false'}
     try:
-        response = requests.get(url, headers=HEADERS, params=params, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
-        results = data.get("results", [])
-        if results:
-            # 按人气排序并返回最受欢迎的人物的 ID
-            sorted_results = sorted(results, key=lambda x: x.get('popularity', 0), reverse=True)
-            return sorted_results[0]["id"]
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB person search API 时发生错误: {e}")
+        person_ids = await _get("/search/person", params, TTL_SHORT, _top_person)
+        return person_ids[0] if person_ids else None
+    except httpx.HTTPError as e:
+        logger.warning(f"请求 TMDB person search API 时发生错误: {e}")
         return None
 
-def get_person_combined_credits(person_id):
+async def get_person_combined_credits(person_id, language=DEFAULT_LANGUAGE):
     """
-    获取一个人物参与的所有影视作品（作为演员或工作人员）。
+    获取一个人物参与的所有影视作品（作为演员或工作人员）, 返回去重后的 MediaItem 列表。
     """
-    params = {'language': 'zh-CN'}
-    url = f"{BASE_URL}/person/{person_id}/combined_credits"
+    params = {'language': language}
     try:
-        response = requests.get(url, headers=HEADERS, params=params, proxies=PROXIES)
-        response.raise_for_status()
-        data = response.json()
-
-        # 使用字典按ID合并 cast 和 crew 列表以自动去重
-        all_works = {}
-
-        # 先添加 crew 成员的作品
-        crew_works = data.get("crew", [])
-        for work in crew_works:
-            if work.get('id'):
-                all_works[work['id']] = work
-
-        # 再添加 cast 成员的作品, 如果有重复的ID, 将会覆盖, 但内容基本相同
-        cast_works = data.get("cast", [])
-        for work in cast_works:
-            if work.get('id'):
-                all_works[work['id']] = work
-
-        # 返回去重后的作品列表
-        return list(all_works.values())
-
-    except requests.exceptions.RequestException as e:
-        print(f"请求 TMDB person combined_credits API 时发生错误: {e}")
-        return []
\ No newline at end of file
+        return await _get(f"/person/{person_id}/combined_credits", params, TTL_META, _combined_works)
+    except httpx.HTTPError as e:
+        logger.warning(f"请求 TMDB person combined_credits API 时发生错误: {e}")
+        return []
@@ -0,0 +1,294 @@
+"""
+基于 TMDB 每日 ID 导出文件的本地索引。
+
+TMDB 每天发布 gzip 压缩的 JSON Lines 文件 (movie_ids_MM_DD_YYYY.json.gz、tv_series_ids_MM_DD_YYYY.json.gz),
+每行包含 id、原始标题和人气。ingest 任务把它们转换成一个紧凑的二进制索引文件, 运行时通过 mmap 加载,
+多个 worker 进程共享同一份页缓存。索引提供:
+
+* IMDb ID -> TMDB ID 的映射 (导出文件本身不含 IMDb ID, 来源是记录中的 imdb_id 字段或 --imdb-map 文件)
+* 按人气排序的标题前缀查找, 以及基于二元组/三元组 (n-gram) 倒排表的子串查找
+
+    python tmdb_index.py --movies movie_ids_05_15_2026.json.gz --tv tv_series_ids_05_15_2026.json.gz \\
+        --imdb-map imdb_map.tsv --output tmdb_index.bin
+"""
+import argparse
+import bisect
+import gzip
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import unicodedata
+import zlib
+from array import array
+from config import TMDB_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TMDBIDX1"
+MEDIA_TYPES = ("movie", "tv")
+
+# 文件头: 魔数, 记录数, IMDb 映射数, n-gram 键数, 倒排表长度, 字符串区长度
+_HEADER = struct.Struct("<8sIIIII")
+# 记录 (按人气降序排列): TMDB ID, 人气, 标题偏移, 规范化标题偏移, 标题长度, 规范化标题长度, 媒体类型
+_RECORD = struct.Struct("<IfIIHHB3x")
+# IMDb 映射 (按 IMDb 数字 ID 排序): IMDb 数字 ID, TMDB ID, 媒体类型
+_IMDB = struct.Struct("<IIB3x")
+# n-gram 键 (按哈希排序): 二元组或三元组的哈希, 倒排表起始位置, 倒排表长度
+_NGRAM = struct.Struct("<III")
+
+def normalize_text(text):
+    """
+    规范化标题或搜索词: 全角转半角 (NFKC)、忽略大小写并合并连续空白。
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.casefold().split())
+
+def _ngrams(key, n):
+    return {zlib.crc32(key[i:i + n].encode("utf-8")) for i in range(len(key) - n + 1)}
+
+def _contains(sorted_values, value):
+    position = bisect.bisect_left(sorted_values, value)
+    return position < len(sorted_values) and sorted_values[position] == value
+
+def _imdb_number(imdb_id):
+    if not imdb_id or not imdb_id.startswith("tt") or not imdb_id[2:].isdigit():
+        return None
+    return int(imdb_id[2:])
+
+def _read_export(path, media_type):
+    title_field = "original_title" if media_type == "movie" else "original_name"
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("adult"):
+                continue
+            title = item.get(title_field) or item.get("title") or item.get("name")
+            if item.get("id") and title:
+                yield media_type, item["id"], title, float(item.get("popularity") or 0), item.get("imdb_id")
+
+def _read_imdb_map(path):
+    """
+    读取 TSV 格式的映射文件, 每行为: imdb_id <TAB> movie|tv <TAB> tmdb_id。
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) == 3 and parts[1] in MEDIA_TYPES and parts[2].isdigit():
+                yield parts[0], parts[1], int(parts[2])
+
+def build_index(output, movie_exports=(), tv_exports=(), imdb_maps=()):
+    """
+    从导出文件构建索引并原子地写入 output。返回写入的记录数。
+    """
+    records = []
+    imdb = {}
+    for media_type, paths in (("movie", movie_exports), ("tv", tv_exports)):
+        for path in paths:
+            for media, tmdb_id, title, popularity, imdb_id in _read_export(path, media_type):
+                records.append((popularity, tmdb_id, MEDIA_TYPES.index(media), title))
+                number = _imdb_number(imdb_id)
+                if number is not None:
+                    imdb[(number, MEDIA_TYPES.index(media))] = tmdb_id
+    for path in imdb_maps:
+        for imdb_id, media_type, tmdb_id in _read_imdb_map(path):
+            number = _imdb_number(imdb_id)
+            if number is not None:
+                imdb[(number, MEDIA_TYPES.index(media_type))] = tmdb_id
+
+    # 记录按人气降序排列, 记录下标越小越热门, 倒排表天然按人气有序
+    records.sort(key=lambda record: -record[0])
+
+    strings = bytearray()
+    packed_records = bytearray()
+    keys = []
+    postings_by_ngram = {}
+    for index, (popularity, tmdb_id, media, title) in enumerate(records):
+        title_bytes = title.encode("utf-8")[:0xFFFF]
+        key = normalize_text(title)
+        key_bytes = key.encode("utf-8")[:0xFFFF]
+        title_offset = len(strings)
+        strings += title_bytes
+        key_offset = len(strings)
+        strings += key_bytes
+        packed_records += _RECORD.pack(tmdb_id, popularity, title_offset, key_offset, len(title_bytes), len(key_bytes), media)
+        keys.append(key_bytes)
+        # 同时索引二元组和三元组, 以支持两个字的中文查询
+        for ngram in _ngrams(key, 2) | _ngrams(key, 3):
+            postings_by_ngram.setdefault(ngram, array("I")).append(index)
+
+    prefix_order = array("I", sorted(range(len(records)), key=keys.__getitem__))
+
+    ngram_table = bytearray()
+    postings = array("I")
+    for ngram in sorted(postings_by_ngram):
+        indices = postings_by_ngram[ngram]
+        ngram_table += _NGRAM.pack(ngram, len(postings), len(indices))
+        postings.extend(indices)
+
+    imdb_table = bytearray()
+    for (number, media), tmdb_id in sorted(imdb.items()):
+        imdb_table += _IMDB.pack(number, tmdb_id, media)
+
+    if sys.byteorder != "little":
+        prefix_order.byteswap()
+        postings.byteswap()
+
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(records), len(imdb), len(postings_by_ngram), len(postings), len(strings)))
+        for section in (packed_records, prefix_order.tobytes(), imdb_table, ngram_table, postings.tobytes(), strings):
+            f.write(section)
+    os.replace(tmp_path, output)
+    return len(records)
+
+class TMDBIndex:
+    """
+    通过 mmap 只读加载的本地索引。加载只读取文件头, 数据按需从页缓存中读取。
+    """
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("TMDB 索引只支持小端序平台")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.record_count, imdb_count, ngram_count, postings_count, strings_size = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是 TMDB 索引文件")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._records = view[offset:offset + self.record_count * _RECORD.size]
+        offset += len(self._records)
+        self._prefix_order = view[offset:offset + self.record_count * 4].cast("I")
+        offset += self.record_count * 4
+        self._imdb = view[offset:offset + imdb_count * _IMDB.size]
+        offset += len(self._imdb)
+        self._ngrams = view[offset:offset + ngram_count * _NGRAM.size]
+        offset += len(self._ngrams)
+        self._postings = view[offset:offset + postings_count * 4].cast("I")
+        offset += postings_count * 4
+        self._strings = view[offset:offset + strings_size]
+        self._imdb_count = imdb_count
+        self._ngram_count = ngram_count
+
+    def _record(self, index):
+        # (TMDB ID, 人气, 标题偏移, 规范化标题偏移, 标题长度, 规范化标题长度, 媒体类型)
+        return _RECORD.unpack_from(self._records, index * _RECORD.size)
+
+    def _key(self, index):
+        _, _, _, key_offset, _, key_len, _ = self._record(index)
+        return bytes(self._strings[key_offset:key_offset + key_len])
+
+    def _result(self, index):
+        tmdb_id, popularity, title_offset, _, title_len, _, media = self._record(index)
+        title = bytes(self._strings[title_offset:title_offset + title_len]).decode("utf-8", errors="replace")
+        return {"id": tmdb_id, "media_type": MEDIA_TYPES[media], "title": title, "popularity": popularity}
+
+    def find_by_imdb(self, imdb_id, media_type):
+        """
+        返回 IMDb ID 对应的 TMDB ID, 索引中没有时返回 None。
+        """
+        number = _imdb_number(imdb_id)
+        if number is None or media_type not in MEDIA_TYPES:
+            return None
+        target = (number, MEDIA_TYPES.index(media_type))
+        low, high = 0, self._imdb_count
+        while low < high:
+            middle = (low + high) // 2
+            entry_number, tmdb_id, media = _IMDB.unpack_from(self._imdb, middle * _IMDB.size)
+            if (entry_number, media) < target:
+                low = middle + 1
+            elif (entry_number, media) > target:
+                high = middle
+            else:
+                return tmdb_id
+        return None
+
+    def _postings_for(self, ngram):
+        low, high = 0, self._ngram_count
+        while low < high:
+            middle = (low + high) // 2
+            key, start, count = _NGRAM.unpack_from(self._ngrams, middle * _NGRAM.size)
+            if key < ngram:
+                low = middle + 1
+            elif key > ngram:
+                high = middle
+            else:
+                return self._postings[start:start + count]
+        return None
+
+    def _prefix_matches(self, prefix):
+        # 在按规范化标题排序的下标数组上二分查找前缀范围
+        order = self._prefix_order
+        start = bisect.bisect_left(range(len(order)), prefix, key=lambda i: self._key(order[i]))
+        for position in range(start, len(order)):
+            index = order[position]
+            if not self._key(index).startswith(prefix):
+                break
+            yield index
+
+    def search(self, query, media_type=None, limit=20):
+        """
+        按人气降序返回标题包含 query 的条目: [{id, media_type, title, popularity}]。
+        单个字符的查询按前缀匹配, 其余按二元组/三元组倒排表求交集后再校验子串。
+        """
+        key = normalize_text(query)
+        if not key:
+            return []
+        media = MEDIA_TYPES.index(media_type) if media_type in MEDIA_TYPES else None
+        key_bytes = key.encode("utf-8")
+
+        if len(key) < 2:
+            candidates = sorted(self._prefix_matches(key_bytes))
+        else:
+            postings = []
+            for ngram in _ngrams(key, min(len(key), 3)):
+                matches = self._postings_for(ngram)
+                if matches is None:
+                    return []
+                postings.append(matches)
+            # 倒排表按人气有序: 沿最短的表顺序遍历, 在其余表中二分确认, 凑够 limit 条即可停止
+            postings.sort(key=len)
+            candidates = (index for index in postings[0] if all(_contains(matches, index) for matches in postings[1:]))
+
+        results = []
+        for index in candidates:
+            record = self._record(index)
+            if media is not None and record[6] != media:
+                continue
+            if key_bytes not in self._key(index):
+                continue
+            results.append(self._result(index))
+            if len(results) >= limit:
+                break
+        return results
+
+def load_index(path):
+    """
+    加载索引; 未配置或文件无效时返回 None, 调用方退回到 TMDB API。
+    """
+    if not path:
+        return None
+    try:
+        return TMDBIndex(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"加载 TMDB 本地索引时发生错误: {e}")
+        return None
+
+index = load_index(TMDB_INDEX_PATH)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 TMDB 每日 ID 导出文件构建本地索引")
+    parser.add_argument("--movies", action="append", default=[], help="movie_ids_*.json.gz, 可重复")
+    parser.add_argument("--tv", action="append", default=[], help="tv_series_ids_*.json.gz, 可重复")
+    parser.add_argument("--imdb-map", action="append", default=[], help="TSV 映射文件: imdb_id, movie|tv, tmdb_id")
+    parser.add_argument("--output", default=TMDB_INDEX_PATH or "tmdb_index.bin")
+    args = parser.parse_args()
+    count = build_index(args.output, args.movies, args.tv, args.imdb_map)
+    print(f"已写入 {count} 条记录到 {args.output}")
@@ -0,0 +1,100 @@
+"""
+编码在插件地址路径中的用户配置, 例如:
+
+    https://example.com/language=en-US&region=US&adult=true&catalogs=movie.tmdb-popular,series.tmdb-popular/manifest.json
+
+支持的配置项:
+
+* language: TMDB 支持的语言代码 (参见 PRIMARY_TRANSLATIONS), 默认 zh-CN
+* region: ISO 3166-1 地区代码, 用于电影的上映日期筛选, 默认不限
+* adult: 是否包含成人内容, 默认 false
+* catalogs: 显示的目录列表 (媒体类型.目录 ID, 逗号分隔), 默认全部显示
+
+没有配置段的地址 (例如 /manifest.json) 等同于全部使用默认值。
+"""
+import re
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+DEFAULT_LANGUAGE = "zh-CN"
+
+# TMDB 支持的翻译语言 (/configuration/primary_translations)。每种语言都会单独请求和缓存类型列表与翻译,
+# 因此只接受这些语言代码及其不带地区的形式, 而不是任意格式正确的代码
+PRIMARY_TRANSLATIONS = (
+    "af-ZA", "ar-AE", "ar-BH", "ar-EG", "ar-IQ", "ar-JO", "ar-LY", "ar-MA", "ar-QA", "ar-SA", "ar-TD", "ar-YE",
+    "be-BY", "bg-BG", "bn-BD", "br-FR", "ca-AD", "ca-ES", "ch-GU", "cs-CZ", "cy-GB", "da-DK", "de-AT", "de-CH",
+    "de-DE", "el-CY", "el-GR", "en-AG", "en-AU", "en-BB", "en-BZ", "en-CA", "en-CM", "en-GB", "en-GG", "en-GH",
+    "en-GI", "en-GY", "en-IE", "en-JM", "en-KE", "en-LC", "en-MW", "en-NZ", "en-PG", "en-TC", "en-US", "en-ZM",
+    "en-ZW", "eo-EO", "es-AR", "es-CL", "es-DO", "es-EC", "es-ES", "es-GQ", "es-GT", "es-HN", "es-MX", "es-NI",
+    "es-PA", "es-PE", "es-PY", "es-SV", "es-UY", "et-EE", "eu-ES", "fa-IR", "fi-FI", "fr-BF", "fr-CA", "fr-CD",
+    "fr-CI", "fr-FR", "fr-GF", "fr-GP", "fr-MC", "fr-ML", "fr-MU", "fr-PF", "ga-IE", "gd-GB", "gl-ES", "he-IL",
+    "hi-IN", "hr-HR", "hu-HU", "id-ID", "it-IT", "it-VA", "ja-JP", "ka-GE", "kk-KZ", "kn-IN", "ko-KR", "ku-TR",
+    "ky-KG", "lt-LT", "lv-LV", "ml-IN", "mr-IN", "ms-MY", "ms-SG", "nb-NO", "nl-BE", "nl-NL", "no-NO", "pa-IN",
+    "pl-PL", "pt-AO", "pt-BR", "pt-MZ", "pt-PT", "ro-MD", "ro-RO", "ru-RU", "si-LK", "sk-SK", "sl-SI", "so-SO",
+    "sq-AL", "sq-XK", "sr-ME", "sr-RS", "sv-SE", "sw-TZ", "ta-IN", "te-IN", "th-TH", "tl-PH", "tr-TR", "uk-UA",
+    "ur-PK", "uz-UZ", "vi-VN", "zh-CN", "zh-HK", "zh-SG", "zh-TW", "zu-ZA",
+)
+LANGUAGES = frozenset(PRIMARY_TRANSLATIONS) | {language.split("-")[0] for language in PRIMARY_TRANSLATIONS}
+
+# 用 fullmatch 匹配整个值 ("$" 会放过末尾的换行)
+_REGION_PATTERN = re.compile(r"[A-Z]{2}")
+_CATALOG_PATTERN = re.compile(r"(movie|series)\.[a-z0-9-]+")
+
+class UserConfig(NamedTuple):
+    language: str = DEFAULT_LANGUAGE
+    region: str = ""
+    adult: bool = False
+    # 为空时显示全部目录
+    catalogs: tuple = ()
+
+    @property
+    def key(self):
+        """
+        规范化的配置段, 用于生成插件地址和缓存键。默认配置为空字符串, 等价的配置得到相同的结果。
+        """
+        params = []
+        if self.language != DEFAULT_LANGUAGE:
+            params.append(("language", self.language))
+        if self.region:
+            params.append(("region", self.region))
+        if self.adult:
+            params.append(("adult", "true"))
+        if self.catalogs:
+            params.append(("catalogs", ",".join(self.catalogs)))
+        return urlencode(params, safe=",")
+
+    def manifest_url(self, base_url):
+        """
+        返回此配置对应的 manifest 地址。
+        """
+        return f"{base_url}/{self.key}/manifest.json" if self.key else f"{base_url}/manifest.json"
+
+    def shows(self, media_type, catalog_id):
+        return not self.catalogs or f"{media_type}.{catalog_id}" in self.catalogs
+
+DEFAULT_CONFIG = UserConfig()
+
+def parse_config(text):
+    """
+    解析地址中的配置段, 格式错误或包含未知配置项时抛出 ValueError。
+    """
+    values = {}
+    for name, value in parse_qsl(text, keep_blank_values=True, strict_parsing=True):
+        if name == "language":
+            if value not in LANGUAGES:
+                raise ValueError(f"无效的语言: {value}")
+            values["language"] = value
+        elif name == "region":
+            if value and not _REGION_PATTERN.fullmatch(value):
+                raise ValueError(f"无效的地区: {value}")
+            values["region"] = value
+        elif name == "adult":
+            values["adult"] = value.lower() in ("true", "1", "yes")
+        elif name == "catalogs":
+            catalogs = [catalog for catalog in value.split(",") if catalog]
+            if not all(_CATALOG_PATTERN.fullmatch(catalog) for catalog in catalogs):
+                raise ValueError(f"无效的目录列表: {value}")
+            values["catalogs"] = tuple(sorted(set(catalogs)))
+        else:
+            raise ValueError(f"未知的配置项: {name}")
+    return UserConfig(**values)